@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+
+# Measure the startup time of the solver modules.
+# Each measurement runs in a fresh python interpreter,
+# so it includes the time to import all dependencies.
+# Usage: python3 benchmarks/startup.py [number of repetitions]
+
+# imports
+import os
+import sys
+import time
+import subprocess
+
+
+# directory holding the source modules
+srcdir = os.path.abspath(os.path.join(os.path.dirname(__file__), '../src'))
+exampledir = os.path.abspath(os.path.join(os.path.dirname(__file__), '../examples'))
+
+# code snippets to measure
+# (the first one is a reference for the startup time of the interpreter itself)
+snippets = {
+  'python only': 'pass',
+  'import Suguru': 'import Suguru',
+  'import SuguruImageReader': 'import SuguruImageReader',
+  'import SuguruSolverGUI': 'import SuguruSolverGUI',
+  'headless solve': ('from Suguru import Suguru\n'
+                     'suguru = Suguru()\n'
+                     'suguru.initfromtxt({})\n'
+                     'suguru.solve()'.format(repr(os.path.join(exampledir, 'example1.txt')))),
+}
+
+
+def measure(snippet, nrepetitions=5):
+	### run a code snippet in fresh interpreters and return the median wall time (in seconds)
+	times = []
+	env = dict(os.environ)
+	env['PYTHONPATH'] = srcdir
+	for i in range(nrepetitions):
+		start = time.perf_counter()
+		subprocess.run([sys.executable, '-c', snippet], env=env, check=True)
+		times.append(time.perf_counter()-start)
+	return sorted(times)[len(times)//2]
+
+
+if __name__=='__main__':
+
+	nrepetitions = int(sys.argv[1]) if len(sys.argv)>1 else 5
+	for name, snippet in snippets.items():
+		print('{:<30} {:8.1f} ms'.format(name, measure(snippet, nrepetitions=nrepetitions)*1000))
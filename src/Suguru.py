@@ -1,9 +1,107 @@
 # -*- coding: utf-8 -*-
 
+import time
+import random
+import hashlib
+import functools
+import collections
 import numpy as np
 from SuguruLayout import SuguruLayout
 
 
+# registry of the solving techniques used by Suguru.propagate
+# (maps the technique name to a dict with the function and the cost, see registertechnique)
+techniqueregistry = {}
+
+
+def registertechnique(name, function, cost):
+	### add a solving technique to the registry (or replace an existing one with the same name)
+	# input arguments:
+	# - name: name of the technique (to be used in Suguru.propagate)
+	# - function: either the name of a Suguru method,
+	#   or a function taking a Suguru instance and a keyword argument verbose;
+	#   in both cases it should apply the technique to the whole grid,
+	#   and return True if it removed any candidate or filled any value, False otherwise
+	# - cost: relative cost of applying the technique once
+	#   (cheaper techniques are applied first)
+	techniqueregistry[name] = {'function': function, 'cost': cost}
+
+
+def techniqueorder():
+	### get the names of all registered techniques, ordered by cost
+	return sorted(techniqueregistry, key=lambda name: techniqueregistry[name]['cost'])
+
+
+# the basic and intermediate solving methods of Suguru
+# (the costs are roughly the measured times of one pass over a typical grid)
+registertechnique('fillsingles', 'fillsingles', 1)
+registertechnique('reduceneighbours', 'reduceneighbours', 4)
+registertechnique('reducegroups', 'reducegroups', 6)
+registertechnique('fillgroups', 'fillgroups', 8)
+registertechnique('reducetuples', 'reducetuples', 9)
+
+
+@functools.lru_cache(maxsize=16)
+def zobristkeys(nrows, ncols, nvalues):
+	### get random 64-bit keys for hashing the state of a grid (see Suguru.inithash)
+	# (the keys only depend on the size of the grid; the layout is included in the hash separately)
+	# returns:
+	# tuple of (candidate keys, fill keys), both nested lists indexed as [row][column][value]
+	rng = random.Random(nrows*1000003+ncols*1009+nvalues)
+	keys = []
+	for k in range(2):
+		keys.append([[[rng.getrandbits(64) for value in range(nvalues)] for j in range(ncols)]
+		             for i in range(nrows)])
+	return tuple(keys)
+
+
+class SuguruNogoods(object):
+	### bounded table of states (see Suguru.statehash) that are known to have no solution
+	# (used by Suguru.iter_solutions to skip the parts of the search tree that were searched before)
+
+	def __init__(self, maxsize=100000, eviction='lru'):
+		### initializer
+		# input arguments:
+		# - maxsize: maximum number of states in the table
+		# - eviction: which state to remove when the table is full, with the following options:
+		#   - 'lru': the state that was least recently added or found
+		#   - 'fifo': the state that was added first
+		if eviction not in ['lru', 'fifo']:
+			msg = 'ERROR in SuguruNogoods.__init__:'
+			msg += ' eviction {} not recognized.'.format(eviction)
+			raise Exception(msg)
+		self.maxsize = maxsize
+		self.eviction = eviction
+		self.table = collections.OrderedDict()
+		# number of lookups and of lookups that found the state
+		self.nlookups = 0
+		self.nhits = 0
+
+	def add(self, statehash):
+		### add a state to the table
+		self.table[statehash] = None
+		self.table.move_to_end(statehash)
+		while len(self.table)>self.maxsize: self.table.popitem(last=False)
+
+	def contains(self, statehash):
+		### check if a state is in the table
+		self.nlookups += 1
+		if statehash not in self.table: return False
+		self.nhits += 1
+		if self.eviction=='lru': self.table.move_to_end(statehash)
+		return True
+
+	def clear(self):
+		### remove all states from the table
+		self.table.clear()
+
+
+class SuguruLimitReached(Exception):
+	### raised inside the solver when the time or step limit of Suguru.solve is reached
+	# (caught by Suguru.solve, see there)
+	pass
+
+
 class Suguru(object):
 	### main object holding the number grid and solver methods
 	
@@ -12,6 +110,25 @@ class Suguru(object):
 		self.layout = None
 		self.grid = None
 		self.candidates = None
+		# counts of each value per group and in the neighbours of each cell,
+		# and the number of conflicting pairs of cells
+		# (kept up to date by setvalue, so the grid should only be modified through setvalue)
+		self.groupcounts = None
+		self.neighbourcounts = None
+		self.nconflicts = 0
+		# order of the techniques used by propagate (default: ordered by cost, see registertechnique)
+		self.techniques = None
+		# time (as given by time.monotonic) and number of steps after which to stop solving
+		# (only set while solving, see solve and countstep)
+		self.deadline = None
+		self.stepsleft = None
+		# number of tentative fills made by probe (used by solve to limit the total number of them)
+		self.nprobes = 0
+		# hash of the layout, grid and candidates (only kept up to date when a table
+		# of states without solution is used, see inithash and setnogoods)
+		self.statehash = 0
+		self.zobristkeys = None
+		self.nogoods = None
 		
 	def initlayout(self, layout):
 		### set the layout with a given SuguruLayout instance
@@ -52,6 +169,7 @@ class Suguru(object):
 			raise Exception(msg)
 		# set the grid
 		self.grid = grid
+		self.initcounts()
 		# set the candidates
 		(nrows, ncols) = self.grid.shape
 		self.candidates = []
@@ -67,6 +185,77 @@ class Suguru(object):
 				else:
 					groupsize = self.layout.groupsize((i,j))
 					self.candidates[i][j] = list(range(1,groupsize+1))
+		self.inithash()
+					
+	def inithash(self):
+		### initialize the hash of the layout, grid and candidates (Zobrist hashing)
+		# the hash is the exclusive or of a hash of the layout, a random key for each candidate in each cell
+		# and a random key for the value in each filled cell, so it can be updated
+		# with a single exclusive or when a candidate is removed or a value is filled
+		# (see removecandidate and setvalue); the grid and candidates should only be modified
+		# through these methods (or setstate), else this method must be called again.
+		# the hash is only kept up to date when a table of states without solution is used
+		# (see setnogoods), else it is 0.
+		if self.nogoods is None:
+			self.zobristkeys = None
+			self.statehash = 0
+			return
+		(nrows, ncols) = self.grid.shape
+		nvalues = max(self.layout.maxgroupsize(), np.amax(self.grid), 9)+1
+		self.zobristkeys = zobristkeys(nrows, ncols, nvalues)
+		(candidatekeys, fillkeys) = self.zobristkeys
+		# (sugurus of the same size with a different layout get unrelated hashes)
+		layoutbytes = np.asarray(self.layout.layout, dtype=np.int64).tobytes()
+		self.statehash = int.from_bytes(hashlib.blake2b(layoutbytes, digest_size=8).digest(), 'little')
+		for i in range(nrows):
+			for j in range(ncols):
+				for value in self.candidates[i][j]: self.statehash ^= candidatekeys[i][j][value]
+				if self.grid[i,j]!=0: self.statehash ^= fillkeys[i][j][self.grid[i,j]]
+					
+	def setnogoods(self, nogoods):
+		### set the table of states without solution used by the search (see iter_solutions)
+		# input arguments:
+		# - nogoods: SuguruNogoods instance (it can be shared between Suguru instances),
+		#   or None to not use a table
+		self.nogoods = nogoods
+		if self.grid is not None: self.inithash()
+					
+	def initcounts(self):
+		### initialize the value counts from the current grid
+		nvalues = max(self.layout.maxgroupsize(), np.amax(self.grid))+1
+		(nrows, ncols) = self.grid.shape
+		self.groupcounts = np.zeros((self.layout.ngroups,nvalues), dtype=int)
+		self.neighbourcounts = np.zeros((nrows,ncols,nvalues), dtype=int)
+		self.nconflicts = 0
+		for cell in np.argwhere(self.grid):
+			self.updatecounts(cell[0], cell[1], self.grid[cell[0],cell[1]], 1)
+					
+	def updatecounts(self, row, column, value, step):
+		### update the value counts for adding (step 1) or removing (step -1) a value in a cell
+		if value>=self.groupcounts.shape[1]:
+			extra = value+1-self.groupcounts.shape[1]
+			self.groupcounts = np.pad(self.groupcounts, ((0,0),(0,extra)))
+			self.neighbourcounts = np.pad(self.neighbourcounts, ((0,0),(0,0),(0,extra)))
+		groupid = self.layout.layout[row,column]
+		if step>0:
+			self.nconflicts += self.groupcounts[groupid,value] + self.neighbourcounts[row,column,value]
+		self.groupcounts[groupid,value] += step
+		for (i,j) in self.layout.neighbourcells[row][column]:
+			self.neighbourcounts[i,j,value] += step
+		if step<0:
+			self.nconflicts -= self.groupcounts[groupid,value] + self.neighbourcounts[row,column,value]
+			
+	def setvalue(self, row, column, value):
+		### set a value in a given cell (0 to clear the cell), keeping the value counts up to date
+		oldvalue = self.grid[row,column]
+		if oldvalue==value: return
+		if oldvalue!=0: self.updatecounts(row, column, oldvalue, -1)
+		self.grid[row,column] = value
+		if value!=0: self.updatecounts(row, column, value, 1)
+		if self.zobristkeys is not None:
+			fillkeys = self.zobristkeys[1][row][column]
+			if oldvalue!=0: self.statehash ^= fillkeys[oldvalue]
+			if value!=0: self.statehash ^= fillkeys[value]
 					
 	def initfromgrids(self, layout, grid):
 		### combination of initlayout and initfromgrid with two provided grids
@@ -122,27 +311,25 @@ class Suguru(object):
 		# check if the position is already filled
 		if( self.grid[row, column]!=0 ): return False
 		# check if the value is still missing in the group
-		if( value not in self.missing_values_in_group((row,column)) ): return False
+		groupid = self.layout.layout[row,column]
+		if( value<1 or value>self.layout.groupsizes[groupid] ): return False
+		if( self.groupcounts[groupid,value]!=0 ): return False
 		# check if the value is already present in one of the neighbours
-		if( value in self.values_in_neighbours(row, column) ): return False
+		if( self.neighbourcounts[row,column,value]!=0 ): return False
 		# else true
 		return True
 	
 	def check_valid(self, row=None, column=None):
 		### check if current grid is valid
 		if( row is None or column is None ):
-			(nrows, ncols) = self.grid.shape
-			for i in range(nrows):
-				for j in range(ncols):
-					if not self.check_valid(row=i, column=j): return False
-			return True
+			return (self.nconflicts==0)
 		value = self.grid[row, column]
 		# check if the position is already filled
 		if( value==0 ): return True
 		# check the neighbours
-		if( value in self.values_in_neighbours(row, column) ): return False
+		if( self.neighbourcounts[row,column,value]!=0 ): return False
 		# check the group
-		if( value in self.other_values_in_group((row, column)) ): return False
+		if( self.groupcounts[self.layout.layout[row,column],value]!=1 ): return False
 		# else true
 		return True		
 	
@@ -181,9 +368,9 @@ class Suguru(object):
 	
 	def missing_values_in_group(self, groupid):
 		### get all missing values in a group
-		values = self.values_in_group(groupid)
-		missing_values = list(range(1,self.layout.groupsize(groupid)+1))
-		for value in values: missing_values.remove(value)
+		groupid = self.layout.groupnumber(groupid)
+		counts = self.groupcounts[groupid]
+		missing_values = [value for value in range(1,self.layout.groupsize(groupid)+1) if counts[value]==0]
 		return missing_values
 	
 	def knowns_in_group(self, groupid):
@@ -213,7 +400,7 @@ class Suguru(object):
 		if cell is None:
 			cells = np.argwhere(self.grid)
 			for cell in cells: 
-				removedcandidate = removedcandidate or self.reduceneighbours(cell, verbose=verbose)
+				if self.reduceneighbours(cell, verbose=verbose): removedcandidate = True
 			return removedcandidate
 		row = cell[0]
 		column = cell[1]
@@ -223,7 +410,7 @@ class Suguru(object):
 			nrow = neighbour[0]
 			ncolumn = neighbour[1]
 			if value in self.candidates[nrow][ncolumn]:
-				self.candidates[nrow][ncolumn].remove(value)
+				self.removecandidate(nrow, ncolumn, value, ('neighbour', row, column))
 				removedcandidate = True
 				if verbose:
 					msg = 'Removed candidate {} from position ({},{})'.format(value,nrow,ncolumn)
@@ -240,7 +427,7 @@ class Suguru(object):
 		if groupid is None:
 			ngroups = self.layout.ngroups
 			for groupid in range(ngroups):
-				removedcandidate = removedcandidate or self.reducegroups(groupid, verbose=verbose)
+				if self.reducegroups(groupid, verbose=verbose): removedcandidate = True
 			return removedcandidate
 		gvalues = self.values_in_group(groupid)
 		gunknowns = self.unknowns_in_group(groupid)
@@ -249,7 +436,7 @@ class Suguru(object):
 			column = cell[1]
 			for value in gvalues:
 				if value in self.candidates[row][column]:
-					self.candidates[row][column].remove(value)
+					self.removecandidate(row, column, value, ('group', groupid, value))
 					removedcandidate = True
 					if verbose:
 						msg = 'Removed candidate {} from position ({},{})'.format(value,row,column)
@@ -265,7 +452,7 @@ class Suguru(object):
 			for j in range(ncols):
 				if( self.grid[i,j]==0 and len(self.candidates[i][j])==1 ):
 					value = self.candidates[i][j][0]
-					self.grid[i,j] = value
+					self.setvalue(i, j, value)
 					filledvalue = True
 					if verbose:
 						msg = 'Filled value {} on position ({},{})'.format(value,i,j)
@@ -282,7 +469,7 @@ class Suguru(object):
 		if groupid is None:
 			ngroups = self.layout.ngroups
 			for groupid in range(ngroups):
-				filledcandidate = filledcandidate or self.fillgroups(groupid, verbose=verbose)
+				if self.fillgroups(groupid, verbose=verbose): filledcandidate = True
 			return filledcandidate
 		gmvalues = self.missing_values_in_group(groupid)
 		gunknowns = self.unknowns_in_group(groupid)
@@ -295,8 +482,7 @@ class Suguru(object):
 					ncandidatespots += 1
 					fixedrow, fixedcolumn = row, column
 			if ncandidatespots == 1:
-				self.grid[fixedrow,fixedcolumn] = value
-				self.candidates[fixedrow][fixedcolumn] = [value]
+				self.assign(fixedrow, fixedcolumn, value, reason=('only', groupid, value))
 				filledcandidate = True
 				if verbose:
 					msg = 'Filled value {} on position ({},{})'.format(value,fixedrow,fixedcolumn)
@@ -312,7 +498,7 @@ class Suguru(object):
 		if groupid is None:
 			ngroups = self.layout.ngroups
 			for groupid in range(ngroups):
-				removedcandidate = removedcandidate or self.reducetuples(groupid, verbose=verbose)
+				if self.reducetuples(groupid, verbose=verbose): removedcandidate = True
 			return removedcandidate
 		gmvalues = self.missing_values_in_group(groupid)
 		gunknowns = self.unknowns_in_group(groupid)
@@ -324,7 +510,7 @@ class Suguru(object):
 			row, column = cell[0], cell[1]
 			for value in gmvalues:
 				if value in self.candidates[row][column]:
-					self.candidates[row][column].remove(value)
+					self.removecandidate(row, column, value, ('tuple', groupid))
 					removedcandidate = True
 					if verbose:
 						msg = 'Removed candidate {} from position ({},{})'.format(value,row,column)
@@ -332,33 +518,338 @@ class Suguru(object):
 						print(msg)
 		return removedcandidate
 					
-	def solve(self, verbose=False):
+	def copystate(self):
+		### get a copy of the current grid and candidates
+		# (can be used to roll back tentative changes with setstate)
+		grid = np.copy(self.grid)
+		candidates = [[list(cell) for cell in row] for row in self.candidates]
+		counts = (np.copy(self.groupcounts), np.copy(self.neighbourcounts), self.nconflicts)
+		return (grid, candidates, counts, self.statehash)
+	
+	def setstate(self, state):
+		### restore the grid and candidates from a state obtained with copystate
+		(grid, candidates, counts, statehash) = state
+		self.grid = np.copy(grid)
+		self.candidates = [[list(cell) for cell in row] for row in candidates]
+		self.groupcounts = np.copy(counts[0])
+		self.neighbourcounts = np.copy(counts[1])
+		self.nconflicts = counts[2]
+		self.statehash = statehash
+		
+	def check_consistent(self):
+		### check if current grid is valid and all unknown cells and values can still be filled
+		if not self.check_valid(): return False
+		# check that all unfilled cells have at least one candidate
+		(nrows, ncols) = self.grid.shape
+		for i in range(nrows):
+			for j in range(ncols):
+				if( self.grid[i,j]==0 and len(self.candidates[i][j])==0 ): return False
+		# check that all missing values in a group have at least one candidate spot
+		for groupid in range(self.layout.ngroups):
+			gunknowns = self.unknowns_in_group(groupid)
+			for value in self.missing_values_in_group(groupid):
+				ncandidatespots = 0
+				for cell in gunknowns:
+					if value in self.candidates[cell[0]][cell[1]]: ncandidatespots += 1
+				if ncandidatespots==0: return False
+		return True
+	
+	def propagate(self, verbose=False, techniques=None):
+		### apply the basic and intermediate solving methods until none of them makes progress
+		# the methods are taken from the technique registry (see registertechnique);
+		# the cheapest one is applied first, and a more expensive one only when all cheaper ones
+		# make no more progress; after any progress, it starts again from the cheapest one.
+		# input arguments:
+		# - techniques: list of technique names to use, in this order
+		#   (default: self.techniques if set, else all registered techniques ordered by cost)
+		# returns:
+		# True if any candidate was removed or any value was filled, False otherwise
+		if techniques is None: techniques = self.techniques
+		if techniques is None: techniques = techniqueorder()
+		functions = []
+		for name in techniques:
+			if name not in techniqueregistry:
+				msg = 'ERROR in Suguru.propagate:'
+				msg += ' technique {} not recognized.'.format(name)
+				raise Exception(msg)
+			function = techniqueregistry[name]['function']
+			if isinstance(function, str): function = getattr(self, function)
+			else: function = functools.partial(function, self)
+			functions.append(function)
+		changed = False
+		index = 0
+		while index<len(functions):
+			self.countstep()
+			if functions[index](verbose=verbose):
+				changed = True
+				index = 0
+			else: index += 1
+		return changed
+	
+	def probe(self, maxcandidates=2, budget=50, verbose=False):
+		### advanced solving method: failed-literal probing
+		# tentatively fill each candidate of a cell, propagate,
+		# and remove the candidate if this leads to a contradiction.
+		# input arguments:
+		# - maxcandidates: only probe cells with at most this number of candidates
+		# - budget: maximum number of tentative fills
+		removedcandidate = False
+		(nrows, ncols) = self.grid.shape
+		cells = []
+		for i in range(nrows):
+			for j in range(ncols):
+				ncandidates = len(self.candidates[i][j])
+				if( self.grid[i,j]==0 and ncandidates>1 and ncandidates<=maxcandidates ):
+					cells.append((ncandidates, i, j))
+		# probe cells with the fewest candidates first
+		cells.sort()
+		for (_, row, column) in cells:
+			for value in list(self.candidates[row][column]):
+				if budget<=0: return removedcandidate
+				budget -= 1
+				self.nprobes += 1
+				# tentatively fill the value and propagate
+				state = self.copystate()
+				try:
+					self.assign(row, column, value)
+					self.propagate()
+					consistent = self.check_consistent()
+				finally:
+					self.setstate(state)
+				if consistent: continue
+				self.removecandidate(row, column, value, ('probe',))
+				removedcandidate = True
+				if verbose:
+					msg = 'Removed candidate {} from position ({},{})'.format(value,row,column)
+					msg += ' because filling it leads to a contradiction.'
+					print(msg)
+		return removedcandidate
+					
+	def removecandidate(self, row, column, value, reason=None):
+		### remove a candidate value from a given cell
+		# all solving methods remove candidates through this method
+		# input arguments:
+		# - reason: tuple describing why the candidate is removed,
+		#   with the name of the solving method followed by its arguments, e.g.
+		#   ('neighbour', row, column): the cell (row, column) holds the same value and is a neighbour,
+		#   ('group', groupid, value): the value is already in the same group,
+		#   ('only', groupid, value): the value can only go in another cell of the group,
+		#   ('tuple', groupid): the missing values of the group fill all its unknown cells,
+		#   ('probe',): filling the value leads to a contradiction,
+		#   ('assign',): the cell is filled with another value.
+		#   (not used here, but see SuguruSession, which keeps track of the dependencies between deductions)
+		self.candidates[row][column].remove(value)
+		if self.zobristkeys is not None: self.statehash ^= self.zobristkeys[0][row][column][value]
+		
+	def assign(self, row, column, value, reason=('assign',)):
+		### fill a value in a given cell and reduce its candidates to this value
+		# input arguments:
+		# - reason: reason for removing the other candidates (see removecandidate)
+		self.setvalue(row, column, value)
+		for other in list(self.candidates[row][column]):
+			if other!=value: self.removecandidate(row, column, other, reason)
+		
+	def branchcell(self):
+		### find the unfilled cell with the fewest candidates (used for branching in search)
+		# returns:
+		# tuple of (row index, column index), or None if all cells are filled
+		bestcell = None
+		bestncandidates = 0
+		(nrows, ncols) = self.grid.shape
+		for i in range(nrows):
+			for j in range(ncols):
+				if self.grid[i,j]!=0: continue
+				ncandidates = len(self.candidates[i][j])
+				if( bestcell is None or ncandidates<bestncandidates ):
+					bestcell = (i,j)
+					bestncandidates = ncandidates
+		return bestcell
+	
+	def branchvalues(self, order='fewest', rng=None):
+		### choose the cell to branch on in search, and the order in which to try its values
+		# input arguments:
+		# - order: see iter_solutions
+		# - rng: random.Random instance for order 'random'
+		# returns:
+		# tuple of (cell, list of values), or (None, None) if all cells are filled
+		if order in ['lexicographic', 'reverse']:
+			unfilled = np.argwhere(self.grid==0)
+			cell = tuple(unfilled[0]) if len(unfilled)>0 else None
+		else: cell = self.branchcell()
+		if cell is None: return (None, None)
+		values = sorted(self.candidates[cell[0]][cell[1]], reverse=(order=='reverse'))
+		if order=='random': rng.shuffle(values)
+		return (cell, values)
+	
+	def iter_solutions(self, limit=None, order='fewest', stop=None, seed=None):
+		### generator over the solutions found by depth-first search
+		# branch on the candidates of an unfilled cell,
+		# and apply the logical solving methods after each tentative fill.
+		# the solutions are produced one by one, so the consumer can stop at any time
+		# (only the states along the current branch are kept in memory).
+		# while the consumer handles a solution, the grid and candidates are set to it;
+		# when the generator finishes (or is closed), they are restored to their initial state.
+		# if a table of states without solution is set (see setnogoods), the nodes whose branches
+		# are exhausted without a solution are added to it, and nodes that are in it are skipped
+		# (the table is kept between searches).
+		# input arguments:
+		# - limit: maximum number of solutions to produce (default: all solutions)
+		# - order: order in which the search tree is explored, with the following options:
+		#   - 'fewest': branch on the cell with the fewest candidates, smallest values first
+		#     (the fastest option in general)
+		#   - 'lexicographic': branch on the first unfilled cell, smallest values first
+		#     (the solutions are produced in lexicographic order of their grids, read row by row)
+		#   - 'reverse': same as 'lexicographic' but with the largest values first (reverse order)
+		#   - 'random': branch on the cell with the fewest candidates, values in random order
+		# - stop: function without arguments, the search is aborted when it returns True
+		# - seed: random seed for order 'random'
+		# returns:
+		# generator over 2D numpy arrays holding the solutions (copies of the grid)
+		if order not in ['fewest', 'lexicographic', 'reverse', 'random']:
+			msg = 'ERROR in Suguru.iter_solutions:'
+			msg += ' order {} not recognized.'.format(order)
+			raise Exception(msg)
+		rng = random.Random(seed)
+		if( self.nogoods is not None and self.zobristkeys is None ): self.inithash()
+		initialstate = self.copystate()
+		nsolutions = 0
+		# the open branches, as a stack of tuples of
+		# (state, cell, values still to try, hashes of the node, number of solutions before the node)
+		stack = []
+		try:
+			while( limit is None or nsolutions<limit ):
+				if( stop is not None and stop() ): return
+				self.countstep()
+				(consistent, hashes) = self.expandnode()
+				if consistent:
+					(cell, values) = self.branchvalues(order, rng)
+					if cell is None:
+						nsolutions += 1
+						yield np.copy(self.grid)
+					else: stack.append((self.copystate(), cell, values, hashes, nsolutions))
+				# go to the next untried value of the deepest open branch
+				while( len(stack)>0 and len(stack[-1][2])==0 ):
+					# (the branch is exhausted; if it has no solutions, remember its node)
+					(_, _, _, hashes, nbefore) = stack.pop()
+					if( self.nogoods is not None and nsolutions==nbefore ):
+						for statehash in hashes: self.nogoods.add(statehash)
+				if len(stack)==0: return
+				(state, (row, column), values, _, _) = stack[-1]
+				self.setstate(state)
+				self.assign(row, column, values.pop(0))
+		finally:
+			self.setstate(initialstate)
+	
+	def expandnode(self):
+		### apply the logical solving methods at a node of the search
+		# (skipped if the state before or after it is in the table of states without solution)
+		# returns:
+		# tuple of (consistent, hashes), with consistent a bool telling if the node can have a solution,
+		# and hashes a list of the hashes of the state before and after applying the solving methods;
+		# if the node is inconsistent, these are added to the table of states without solution
+		if self.nogoods is None:
+			self.propagate()
+			return (self.check_consistent(), [])
+		hashes = [self.statehash]
+		if self.nogoods.contains(self.statehash): return (False, hashes)
+		self.propagate()
+		if self.statehash!=hashes[0]:
+			hashes.append(self.statehash)
+			if self.nogoods.contains(self.statehash):
+				self.nogoods.add(hashes[0])
+				return (False, hashes)
+		if self.check_consistent(): return (True, hashes)
+		for statehash in hashes: self.nogoods.add(statehash)
+		return (False, hashes)
+
+	def countstep(self):
+		### count a step of the solver (a pass of a solving technique or a node of the search)
+		# and raise SuguruLimitReached if the time or step limit is reached
+		# (cheap enough to be called for every step; does nothing when no limits are set)
+		if self.stepsleft is not None:
+			self.stepsleft -= 1
+			if self.stepsleft<0: raise SuguruLimitReached('step limit reached')
+		if( self.deadline is not None and time.monotonic()>self.deadline ):
+			raise SuguruLimitReached('time limit reached')
+
+	def search(self, count=False, stop=None, verbose=False):
+		### advanced solving method: depth-first search
+		# (see iter_solutions)
+		# input arguments:
+		# - count: if False, stop after the first solution, else count all solutions
+		# - stop: function without arguments, the search is aborted when it returns True
+		# returns:
+		# the number of solutions found;
+		# the grid and candidates are set to the first solution (or left unchanged if none)
+		nsolutions = 0
+		solution = None
+		for grid in self.iter_solutions(limit=(None if count else 1), stop=stop):
+			if solution is None: solution = self.copystate()
+			nsolutions += 1
+		if solution is None: return nsolutions
+		self.setstate(solution)
+		if verbose:
+			msg = 'Filled remaining cells by search'
+			if count: msg += ' ({} solutions found)'.format(nsolutions)
+			print(msg+'.')
+		return nsolutions
+					
+	def solve(self, verbose=False, probe=True, probemaxcandidates=2, probebudget=50, 
+	          search=False, techniques=None, timelimit=None, steplimit=None):
 		### total solving method grouping all submethods
+		# input arguments:
+		# - probe: whether to use failed-literal probing
+		#   when the other solving methods make no more progress
+		# - probemaxcandidates: see the probe method
+		# - probebudget: maximum total number of tentative fills for probing
+		#   (over all rounds of probing, see the probe method)
+		# - search: whether to use search to fill the cells that remain unknown
+		#   after the logical solving methods
+		# - techniques: list of technique names to use (in this order) instead of the default order,
+		#   also while probing and searching (see propagate; only for this call)
+		# - timelimit: maximum time in seconds to spend on solving
+		# - steplimit: maximum number of steps to spend on solving
+		#   (a step is a pass of a solving technique over the grid or a node of the search, see countstep)
+		#   when a limit is reached, the solving stops and the grid and candidates hold
+		#   everything that was deduced so far (a search in progress is undone)
 		# return type: 
 		#   tuple of (int, info string)
 		#   with following convention:
 		#   - -1 = invalid suguru (either invalid input or bug in solver) 
 		#   - 0 = suguru valid and solved completely
 		#   - 1 = suguru valid but not solved completely (solver not powerful enough)
+		#     (does not occur if search is True)
+		#   - 2 = suguru not solved completely because the time or step limit was reached
 		
-		# solve as far as possible
-		donext = True
-		while donext:
-			removedneighbour = self.reduceneighbours(verbose=verbose)
-			removedgroup = self.reducegroups(verbose=verbose)
-			filledsingle = self.fillsingles(verbose=verbose)
-			filledgroup = self.fillgroups(verbose=verbose)
-			reducedtuple = self.reducetuples(verbose=verbose)
-			donext = (
-			  removedneighbour 
-			  or removedgroup 
-			  or filledsingle 
-			  or filledgroup
-			  or reducedtuple
-		    )
+		oldtechniques = self.techniques
+		if techniques is not None: self.techniques = list(techniques)
+		self.deadline = None if timelimit is None else time.monotonic()+timelimit
+		self.stepsleft = steplimit
+		limitreached = False
+		nprobesbefore = self.nprobes
+		try:
+			# solve as far as possible
+			donext = True
+			while donext:
+				self.propagate(verbose=verbose)
+				donext = False
+				budget = probebudget-(self.nprobes-nprobesbefore)
+				if( probe and budget>0 and not self.check_complete() and self.check_consistent() ):
+					donext = self.probe(maxcandidates=probemaxcandidates, 
+					                    budget=budget, verbose=verbose)
+			if( search and not self.check_complete() and self.check_consistent() ):
+				if self.search(verbose=verbose)==0: return (-1, 'Suguru invalid')
+		except SuguruLimitReached as e:
+			limitreached = True
+			if verbose: print('Stopped solving: {}.'.format(e))
+		finally:
+			self.techniques = oldtechniques
+			self.deadline = None
+			self.stepsleft = None
 		# return info on result
-		valid = self.check_valid()
+		valid = self.check_consistent()
 		complete = self.check_complete()
 		if not valid: return (-1, 'Suguru invalid')
+		if( not complete and limitreached ): return (2, 'Suguru limit reached')
 		if not complete: return (1, 'Suguru incomplete')
-		return (0, 'Suguru solved')
\ No newline at end of file
+		return (0, 'Suguru solved')
@@ -0,0 +1,365 @@
+# -*- coding: utf-8 -*-
+
+# Solving large batches of sugurus in parallel over multiple processes.
+# - solvebatch: the layouts and grids of the whole batch are put in shared memory once,
+#   the worker processes solve slices of the batch and write the solutions back into shared memory,
+#   so only the index ranges of the slices (and the number of solved sugurus) are sent between processes.
+# - runjob: long-running jobs reading the sugurus from a file and writing the results to a file,
+#   with periodic checkpoints, so that a job that was interrupted can be resumed.
+#
+# Usage: python3 src/SuguruBatch.py <input file> -o <output file> [--kind solve|reduce] [--resume]
+#   (the input file has one json object per line with "layout" and "grid" and optionally "id",
+#    as written by SuguruImagePipeline.py)
+
+# imports
+import os
+import json
+import time
+import argparse
+import itertools
+import collections
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+from SuguruLayout import SuguruLayout
+from Suguru import Suguru
+from SuguruReducer import reducegivens
+
+
+# state of worker processes
+# (set once per process by initworker)
+workerstate = {'blocks': [], 'arrays': None, 'options': None}
+
+
+def makearrays(buffers, npuzzles, nrows, ncols):
+	### make the numpy arrays of a batch on top of the given buffers
+	# input arguments:
+	# - buffers: list of the buffers of the shared memory blocks (see sharedblocks)
+	# - npuzzles, nrows and ncols: number of sugurus in the batch and size of the largest grid
+	# returns:
+	# dict with the arrays 'shapes', 'layouts', 'grids', 'solutions' and 'resultcodes'
+	(shapes, layouts, grids, solutions, resultcodes) = buffers
+	return {'shapes': np.ndarray((npuzzles,2), dtype=np.int32, buffer=shapes),
+	        'layouts': np.ndarray((npuzzles,nrows,ncols), dtype=np.int32, buffer=layouts),
+	        'grids': np.ndarray((npuzzles,nrows,ncols), dtype=np.int8, buffer=grids),
+	        'solutions': np.ndarray((npuzzles,nrows,ncols), dtype=np.int8, buffer=solutions),
+	        'resultcodes': np.ndarray(npuzzles, dtype=np.int8, buffer=resultcodes)}
+
+
+def sharedblocks(npuzzles, nrows, ncols):
+	### create the shared memory blocks for a batch
+	# returns:
+	# list of SharedMemory instances (in the order expected by makearrays)
+	itemsizes = [2*4, nrows*ncols*4, nrows*ncols, nrows*ncols, 1]
+	return [shared_memory.SharedMemory(create=True, size=max(1, npuzzles*itemsize)) for itemsize in itemsizes]
+
+
+def initworker(names, npuzzles, nrows, ncols, options):
+	### initialize a worker process by attaching to the shared memory blocks of the batch
+	# input arguments:
+	# - names: names of the shared memory blocks
+	# - npuzzles, nrows and ncols: see makearrays
+	# - options: dict with keyword arguments for Suguru.solve
+	# (the blocks are kept open in workerstate, as the arrays refer to their buffers)
+	workerstate['blocks'] = [shared_memory.SharedMemory(name=name) for name in names]
+	workerstate['arrays'] = makearrays([block.buf for block in workerstate['blocks']], npuzzles, nrows, ncols)
+	workerstate['options'] = options
+
+
+def solveslice(task):
+	### solve a slice of the batch in a worker process
+	# input arguments:
+	# - task: tuple of (first index, last index + 1)
+	# returns:
+	# the number of sugurus in the slice that were solved completely
+	(start, stop) = task
+	arrays = workerstate['arrays']
+	# (consecutive sugurus with the same layout share a SuguruLayout instance)
+	layout = None
+	layoutkey = None
+	nsolved = 0
+	for index in range(start, stop):
+		(nrows, ncols) = arrays['shapes'][index]
+		key = arrays['layouts'][index,:nrows,:ncols].tobytes()
+		try:
+			if( layout is None or key!=layoutkey ):
+				layout = SuguruLayout()
+				layout.initfromgrid(arrays['layouts'][index,:nrows,:ncols].astype(int))
+				layoutkey = key
+			suguru = Suguru()
+			suguru.initlayout(layout)
+			suguru.initfromgrid(arrays['grids'][index,:nrows,:ncols].astype(int))
+			(resultcode, _) = suguru.solve(**workerstate['options'])
+			arrays['solutions'][index,:nrows,:ncols] = suguru.grid
+		except Exception:
+			layout = None
+			resultcode = -1
+		arrays['resultcodes'][index] = resultcode
+		if resultcode==0: nsolved += 1
+	return nsolved
+
+
+def solvebatch(layouts, grids, nprocesses=None, slicesize=None, **options):
+	### solve a batch of sugurus in parallel, using shared memory to pass them to the worker processes
+	# input arguments:
+	# - layouts and grids: lists of 2D numpy arrays (or 3D numpy arrays) with the layouts and known values
+	#   (the grids of different sugurus in the batch can have different sizes)
+	# - nprocesses: number of worker processes (default: number of cpus)
+	# - slicesize: number of sugurus per task sent to a worker (default: about 4 tasks per worker process)
+	# - options: keyword arguments for Suguru.solve (e.g. search=True or timelimit=1)
+	# returns:
+	# tuple of (solutions, resultcodes), with solutions a list of 2D numpy arrays
+	# and resultcodes a numpy array with the result code for each suguru (see Suguru.solve;
+	# -1 is also used for invalid input)
+	npuzzles = len(grids)
+	if len(layouts)!=npuzzles:
+		msg = 'ERROR in solvebatch:'
+		msg += ' found {} layouts but {} grids.'.format(len(layouts), npuzzles)
+		raise Exception(msg)
+	if npuzzles==0: return ([], np.zeros(0, dtype=int))
+	shapes = [np.shape(grid) for grid in grids]
+	for (index, layout) in enumerate(layouts):
+		if np.shape(layout)!=shapes[index] or len(shapes[index])!=2:
+			msg = 'ERROR in solvebatch:'
+			msg += ' layout and grid {} must be 2D arrays of the same shape.'.format(index)
+			raise Exception(msg)
+	nrows = max(shape[0] for shape in shapes)
+	ncols = max(shape[1] for shape in shapes)
+	if nprocesses is None: nprocesses = mp.cpu_count()
+	if slicesize is None: slicesize = max(1, -(-npuzzles//(4*nprocesses)))
+	blocks = sharedblocks(npuzzles, nrows, ncols)
+	arrays = None
+	try:
+		arrays = makearrays([block.buf for block in blocks], npuzzles, nrows, ncols)
+		arrays['shapes'][:] = shapes
+		arrays['layouts'][:] = 0
+		arrays['grids'][:] = 0
+		arrays['solutions'][:] = 0
+		arrays['resultcodes'][:] = -1
+		for index in range(npuzzles):
+			(nrowsi, ncolsi) = shapes[index]
+			arrays['layouts'][index,:nrowsi,:ncolsi] = layouts[index]
+			arrays['grids'][index,:nrowsi,:ncolsi] = grids[index]
+		tasks = [(start, min(start+slicesize, npuzzles)) for start in range(0, npuzzles, slicesize)]
+		initargs = ([block.name for block in blocks], npuzzles, nrows, ncols, options)
+		with mp.Pool(processes=nprocesses, initializer=initworker, initargs=initargs) as pool:
+			for _ in pool.imap_unordered(solveslice, tasks): pass
+		solutions = [arrays['solutions'][index,:shape[0],:shape[1]].astype(int) for (index, shape) in enumerate(shapes)]
+		resultcodes = arrays['resultcodes'].astype(int)
+	finally:
+		# (release the views on the buffers before closing the blocks)
+		arrays = None
+		for block in blocks:
+			block.close()
+			block.unlink()
+	return (solutions, resultcodes)
+
+
+def runtask(task):
+	### solve or reduce a single suguru of a job (in a worker process)
+	# input arguments:
+	# - task: tuple of (index in the input, input record, kind, options), see runjob
+	# returns:
+	# dict with the output record
+	(index, record, kind, options) = task
+	result = {'id': record.get('id', index)}
+	try:
+		suguru = Suguru()
+		suguru.initfromgrids(np.array(record['layout'], dtype=int), np.array(record['grid'], dtype=int))
+		if kind=='solve':
+			(resultcode, resultmessage) = suguru.solve(**options)
+			result.update({'resultcode': resultcode, 'resultmessage': resultmessage,
+			               'solution': suguru.grid.tolist()})
+		else:
+			# (the random seed depends on the position in the input, so a resumed job gives the same results)
+			options = dict(options)
+			options['seed'] = index if options.get('seed') is None else options['seed']*1000003+index
+			givens = reducegivens(suguru, **options)
+			result.update({'layout': record['layout'], 'grid': givens.tolist(),
+			               'ngivens': int(np.count_nonzero(givens))})
+	except Exception as e:
+		result['error'] = str(e)
+	return result
+
+
+def readcheckpoint(checkpointfile):
+	### read a checkpoint written by writecheckpoint (None if the file does not exist)
+	if not os.path.exists(checkpointfile): return None
+	with open(checkpointfile, 'r') as f:
+		return json.load(f)
+
+
+def writecheckpoint(checkpointfile, checkpoint):
+	### write a checkpoint atomically
+	# (it is written to a temporary file first, which then replaces the checkpoint file,
+	#  so the checkpoint file always holds either the previous or the new checkpoint)
+	tmpfile = checkpointfile+'.tmp'
+	with open(tmpfile, 'w') as f:
+		json.dump(checkpoint, f)
+		f.flush()
+		os.fsync(f.fileno())
+	os.replace(tmpfile, checkpointfile)
+
+
+def readtasks(inputfile, offset, index, kind, options):
+	### generator over the tasks of a job, starting from a given position in the input file
+	# input arguments:
+	# - inputfile: open input file (in binary mode)
+	# - offset and index: byte offset and index of the first record to read
+	# returns:
+	# generator over tuples of (byte offset after the record, task), see runtask
+	inputfile.seek(offset)
+	while True:
+		line = inputfile.readline()
+		if not line: return
+		offset = inputfile.tell()
+		if line.strip()==b'': continue
+		yield (offset, (index, json.loads(line), kind, options))
+		index += 1
+
+
+def runtaskwithoffset(item):
+	### run a task of a job, passing on the byte offset in the input file (see readtasks)
+	(offset, task) = item
+	return (offset, runtask(task))
+
+
+def runchunk(items):
+	### run a list of tasks of a job (see runtaskwithoffset)
+	return [runtaskwithoffset(item) for item in items]
+
+
+def imapbounded(pool, items, chunksize, maxpending):
+	### run the tasks of a job in a pool, in order, reading only a bounded number of tasks ahead
+	# (unlike pool.imap, which reads all items from the generator as fast as it can,
+	# so that the whole input file would end up in memory)
+	# input arguments:
+	# - pool: multiprocessing Pool
+	# - items: iterator over tuples of (byte offset, task), see readtasks
+	# - chunksize: number of tasks sent to a worker process at once
+	# - maxpending: maximum number of chunks that are submitted but not yet returned
+	# returns:
+	# generator over tuples of (byte offset, result), in the same order as the items
+	pending = collections.deque()
+	while True:
+		while len(pending)<maxpending:
+			chunk = list(itertools.islice(items, chunksize))
+			if len(chunk)==0: break
+			pending.append(pool.apply_async(runchunk, (chunk,)))
+		if len(pending)==0: return
+		for result in pending.popleft().get(): yield result
+
+
+def runjob(inputfile, outputfile, kind='solve', resume=False, checkpointfile=None, checkpointinterval=30.,
+           nprocesses=None, chunksize=16, verbose=False, **options):
+	### run a long job solving (or reducing) all sugurus in a file, with checkpoints
+	# the output records are written in the same order as the input records,
+	# and a checkpoint is written every checkpointinterval seconds (and when the job stops, also on errors).
+	# the checkpoint holds the position in the input file and the output file up to which the job is done,
+	# the number of records done, the id of the last record done, and statistics of the results.
+	# when resuming, the output file is cut back to the position in the checkpoint (removing the records
+	# written after it, which are done again), and the job continues from the position in the input file
+	# (an error is raised if the output file is missing or shorter than in the checkpoint).
+	# input arguments:
+	# - inputfile: file with one json object per line, with keys 'layout' and 'grid' and optionally 'id'
+	#   (default id: the index of the record in the file)
+	# - outputfile: file to write one json object per line to, with the id and the result
+	# - kind: either 'solve' (solve the sugurus, with result code, message and solution, see Suguru.solve)
+	#   or 'reduce' (make puzzles from solved sugurus, with the reduced givens, see reducegivens)
+	# - resume: whether to resume from the checkpoint (if there is one) instead of starting from scratch
+	# - checkpointfile: path of the checkpoint file (default: outputfile with '.checkpoint' appended)
+	# - checkpointinterval: time in seconds between checkpoints
+	# - nprocesses: number of worker processes (default: number of cpus)
+	# - chunksize: number of records sent to a worker process at once
+	#   (at most 4 chunks per worker process are read ahead of the records written)
+	# - options: keyword arguments for Suguru.solve or reducegivens
+	# returns:
+	# dict with the final checkpoint
+	if kind not in ['solve', 'reduce']:
+		msg = 'ERROR in runjob:'
+		msg += ' kind {} not recognized.'.format(kind)
+		raise Exception(msg)
+	if checkpointfile is None: checkpointfile = outputfile+'.checkpoint'
+	checkpoint = readcheckpoint(checkpointfile) if resume else None
+	if checkpoint is not None:
+		if( checkpoint['inputfile']!=os.path.abspath(inputfile) or checkpoint['kind']!=kind ):
+			msg = 'ERROR in runjob:'
+			msg += ' checkpoint {} belongs to a different job'.format(checkpointfile)
+			msg += ' ({} of {}).'.format(checkpoint['kind'], checkpoint['inputfile'])
+			raise Exception(msg)
+		outputsize = os.path.getsize(outputfile) if os.path.exists(outputfile) else None
+		if( outputsize is None or outputsize<checkpoint['outputoffset'] ):
+			msg = 'ERROR in runjob:'
+			if outputsize is None: msg += ' output file {} does not exist,'.format(outputfile)
+			else: msg += ' output file {} is shorter than in the checkpoint,'.format(outputfile)
+			msg += ' so the job cannot be resumed from checkpoint {}'.format(checkpointfile)
+			msg += ' (run it again without resuming, or remove the checkpoint).'
+			raise Exception(msg)
+		output = open(outputfile, 'r+b')
+		output.truncate(checkpoint['outputoffset'])
+		output.seek(checkpoint['outputoffset'])
+	else:
+		checkpoint = {'inputfile': os.path.abspath(inputfile), 'kind': kind,
+		              'inputoffset': 0, 'outputoffset': 0, 'ndone': 0, 'lastid': None,
+		              'stats': {}, 'elapsed': 0., 'finished': False}
+		output = open(outputfile, 'wb')
+	if( checkpoint['finished'] and verbose ): print('Job was already finished.')
+	starttime = time.time()
+	elapsed = checkpoint['elapsed']
+	lastcheckpoint = starttime
+	try:
+		if nprocesses is None: nprocesses = mp.cpu_count()
+		with open(inputfile, 'rb') as inputf, mp.Pool(processes=nprocesses) as pool:
+			tasks = readtasks(inputf, checkpoint['inputoffset'], checkpoint['ndone'], kind, options)
+			for (offset, result) in imapbounded(pool, tasks, chunksize, 4*nprocesses):
+				output.write((json.dumps(result)+'\n').encode('utf-8'))
+				# (only update the checkpoint after the record is written completely)
+				if 'error' in result: key = 'error'
+				elif kind=='solve': key = str(result['resultcode'])
+				else: key = 'reduced'
+				checkpoint['stats'][key] = checkpoint['stats'].get(key, 0)+1
+				checkpoint['inputoffset'] = offset
+				checkpoint['outputoffset'] = output.tell()
+				checkpoint['ndone'] += 1
+				checkpoint['lastid'] = result['id']
+				if time.time()-lastcheckpoint>checkpointinterval:
+					output.flush()
+					os.fsync(output.fileno())
+					checkpoint['elapsed'] = elapsed+time.time()-starttime
+					writecheckpoint(checkpointfile, checkpoint)
+					lastcheckpoint = time.time()
+					if verbose: print('Checkpoint: {} records done.'.format(checkpoint['ndone']))
+		checkpoint['finished'] = True
+	finally:
+		output.flush()
+		os.fsync(output.fileno())
+		output.close()
+		checkpoint['elapsed'] = elapsed+time.time()-starttime
+		writecheckpoint(checkpointfile, checkpoint)
+	return checkpoint
+
+
+if __name__=='__main__':
+
+	parser = argparse.ArgumentParser(description='Solve (or reduce) all sugurus in a file, with checkpoints')
+	parser.add_argument('input', help='Input file (one json object per line with layout and grid)')
+	parser.add_argument('-o', '--output', required=True, help='Output file (one json object per line)')
+	parser.add_argument('-k', '--kind', default='solve', choices=['solve', 'reduce'])
+	parser.add_argument('-r', '--resume', action='store_true',
+	                    help='Resume from the checkpoint of an interrupted job')
+	parser.add_argument('--checkpoint', default=None,
+	                    help='Checkpoint file (default: output file with .checkpoint appended)')
+	parser.add_argument('--interval', type=float, default=30.,
+	                    help='Time between checkpoints in seconds')
+	parser.add_argument('--search', action='store_true',
+	                    help='Use search when solving')
+	parser.add_argument('-n', '--nprocesses', type=int, default=None)
+	parser.add_argument('--chunksize', type=int, default=16)
+	args = parser.parse_args()
+
+	options = {'search': args.search} if args.kind=='solve' else {}
+	checkpoint = runjob(args.input, args.output, kind=args.kind, resume=args.resume,
+	                    checkpointfile=args.checkpoint, checkpointinterval=args.interval,
+	                    nprocesses=args.nprocesses, chunksize=args.chunksize, verbose=True, **options)
+	print('Done {} records in {:.1f} s: {}'.format(checkpoint['ndone'], checkpoint['elapsed'],
+	                                              checkpoint['stats']))
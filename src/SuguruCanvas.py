@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+
+# imports
+import numpy as np
+try:
+        import Tkinter as tk
+except ImportError:
+        import tkinter as tk
+
+class SuguruCanvas:
+        ### view of a suguru grid drawn on a single Tk canvas
+        # meant for large grids, for which creating a Tk Entry for every cell
+        # and a Checkbutton for every candidate becomes too slow.
+        # the canvas keeps the text and colors of the cells of the layout grid and the digit grid,
+        # and the candidates of each cell, and draws them as canvas items;
+        # after a change, only the changed cells are redrawn (once the GUI is idle).
+        # cells are selected with the left mouse button; values are entered with the keyboard:
+        # - digits (and '_') are typed into the selected cell (replacing its content after selecting it),
+        #   BackSpace and Delete clear it
+        # - arrow keys, Tab and Return move the selection
+        # - in the digit grid, clicking a small candidate digit with the right mouse button toggles it
+        #   (the candidates are shown for the selected cell and for cells with removed candidates)
+        # for use in SuguruSolverGUI, the cells and candidates can be accessed through
+        # CanvasCell and CanvasCandidate objects, which behave like a Tk Entry and a Tk IntVar.
+        # edits by the user in the digit grid can be followed by setting oncellchange and oncandidatechange
+        # (functions called with arguments (i, j) and (i, j, k) respectively).
+
+        def __init__(self, master, nrows, ncols, maxgroupsize, cellsize=None):
+                ### initializer
+                # input arguments:
+                # - master: parent widget
+                # - nrows, ncols and maxgroupsize: see SuguruSolverGUI.initgrid
+                # - cellsize: size of a cell in pixels (default: depending on the grid size)
+                self.nrows = nrows
+                self.ncols = ncols
+                self.maxgroupsize = maxgroupsize
+                if cellsize is None: cellsize = min(40, max(16, 800//max(nrows,ncols)))
+                self.cellsize = cellsize
+                self.pad = 2
+                # number of candidates per row within a cell
+                self.ncandcols = int(np.ceil(np.sqrt(maxgroupsize)))
+                # state of the cells
+                # (mode 'L' for the layout grid, 'G' for the digit grid, as in SuguruSolverGUI.editmode)
+                self.mode = 'L'
+                self.texts = {}
+                self.foregrounds = {}
+                self.backgrounds = {}
+                for mode in ['L','G']:
+                        self.texts[mode] = [['']*ncols for i in range(nrows)]
+                        self.foregrounds[mode] = [['black']*ncols for i in range(nrows)]
+                        self.backgrounds[mode] = [['white']*ncols for i in range(nrows)]
+                self.candidates = np.ones((nrows,ncols,maxgroupsize), dtype=bool)
+                self.selected = None
+                # whether the next typed digit replaces the text of the selected cell (instead of appending)
+                self.replacetext = True
+                # functions called after the user edits a cell or candidate in the digit grid
+                self.oncellchange = None
+                self.oncandidatechange = None
+                # canvas items
+                self.canvas = tk.Canvas(master, width=ncols*cellsize+2*self.pad, height=nrows*cellsize+2*self.pad,
+                        background='white', highlightthickness=0)
+                self.rects = []
+                for i in range(nrows):
+                        self.rects.append([])
+                        for j in range(ncols):
+                                (x0, y0) = self.cellorigin(i, j)
+                                rect = self.canvas.create_rectangle(x0, y0, x0+cellsize, y0+cellsize,
+                                        fill='white', outline='gray')
+                                self.rects[i].append(rect)
+                self.selectionrect = self.canvas.create_rectangle(0, 0, 0, 0, outline='blue', width=3, state='hidden')
+                # dynamic items (text) per cell
+                self.items = {}
+                # cells to redraw
+                self.dirty = set()
+                self.redrawpending = False
+                # bindings
+                self.canvas.bind('<Button-1>', self.onleftclick)
+                self.canvas.bind('<Button-3>', self.onrightclick)
+                self.canvas.bind('<Key>', self.onkey)
+
+        def grid(self, **kwargs):
+                ### place the canvas in its parent widget (see tk grid)
+                self.canvas.grid(**kwargs)
+
+        def grid_forget(self):
+                self.canvas.grid_forget()
+
+        def destroy(self):
+                self.canvas.destroy()
+
+        def setmode(self, mode):
+                ### switch between showing the layout grid ('L') and the digit grid ('G')
+                if mode==self.mode: return
+                self.mode = mode
+                for i in range(self.nrows):
+                        for j in range(self.ncols): self.markdirty(i, j)
+
+        def cell(self, mode, i, j):
+                ### get an Entry-like object for a cell (see CanvasCell)
+                return CanvasCell(self, mode, i, j)
+
+        def candidate(self, i, j, k):
+                ### get an IntVar-like object for candidate k+1 of a cell (see CanvasCandidate)
+                return CanvasCandidate(self, i, j, k)
+
+        def cellorigin(self, i, j):
+                ### get the canvas coordinates of the top left corner of a cell
+                return (self.pad+j*self.cellsize, self.pad+i*self.cellsize)
+
+        def findcell(self, x, y):
+                ### get the cell at given canvas coordinates (or None if outside the grid)
+                i = int((y-self.pad)//self.cellsize)
+                j = int((x-self.pad)//self.cellsize)
+                if( i<0 or i>=self.nrows or j<0 or j>=self.ncols ): return None
+                return (i, j)
+
+        def markdirty(self, i, j):
+                ### mark a cell to be redrawn once the GUI is idle
+                self.dirty.add((i, j))
+                if not self.redrawpending:
+                        self.redrawpending = True
+                        self.canvas.after_idle(self.redraw)
+
+        def redraw(self):
+                ### redraw all cells marked with markdirty
+                dirty = self.dirty
+                self.dirty = set()
+                self.redrawpending = False
+                for (i, j) in dirty: self.drawcell(i, j)
+
+        def candidatesshown(self, i, j):
+                ### check whether the candidates of a cell are shown
+                if self.mode!='G': return False
+                if self.texts['G'][i][j]!='': return False
+                return( self.selected==(i, j) or not np.all(self.candidates[i,j]) )
+
+        def drawcell(self, i, j):
+                ### draw the content of a single cell
+                mode = self.mode
+                self.canvas.itemconfig(self.rects[i][j], fill=self.backgrounds[mode][i][j])
+                for item in self.items.pop((i, j), []): self.canvas.delete(item)
+                items = []
+                (x0, y0) = self.cellorigin(i, j)
+                text = self.texts[mode][i][j]
+                if text!='':
+                        items.append(self.canvas.create_text(x0+self.cellsize/2, y0+self.cellsize/2, text=text,
+                                fill=self.foregrounds[mode][i][j], font=('Calibri', -int(self.cellsize*0.6))))
+                elif self.candidatesshown(i, j):
+                        subsize = self.cellsize/self.ncandcols
+                        for k in np.nonzero(self.candidates[i,j])[0]:
+                                (subrow, subcol) = divmod(int(k), self.ncandcols)
+                                items.append(self.canvas.create_text(x0+(subcol+0.5)*subsize, y0+(subrow+0.5)*subsize,
+                                        text=str(k+1), fill='green', font=('Calibri', -max(6, int(subsize*0.8)))))
+                if len(items)>0: self.items[(i, j)] = items
+
+        def select(self, i, j):
+                ### select a cell for keyboard input
+                previous = self.selected
+                self.selected = (i, j)
+                self.replacetext = True
+                (x0, y0) = self.cellorigin(i, j)
+                self.canvas.coords(self.selectionrect, x0+1, y0+1, x0+self.cellsize-1, y0+self.cellsize-1)
+                self.canvas.itemconfig(self.selectionrect, state='normal')
+                self.canvas.tag_raise(self.selectionrect)
+                # (the candidates shown depend on the selection)
+                if previous is not None: self.markdirty(*previous)
+                self.markdirty(i, j)
+
+        def onleftclick(self, event):
+                self.canvas.focus_set()
+                cell = self.findcell(event.x, event.y)
+                if cell is not None: self.select(*cell)
+
+        def onrightclick(self, event):
+                ### toggle the candidate under the mouse pointer
+                if self.mode!='G': return
+                cell = self.findcell(event.x, event.y)
+                if cell is None: return
+                (i, j) = cell
+                if not self.candidatesshown(i, j): return
+                (x0, y0) = self.cellorigin(i, j)
+                subsize = self.cellsize/self.ncandcols
+                k = int((event.y-y0)//subsize)*self.ncandcols + int((event.x-x0)//subsize)
+                if k>=self.maxgroupsize: return
+                self.candidates[i,j,k] = not self.candidates[i,j,k]
+                self.markdirty(i, j)
+                if self.oncandidatechange is not None: self.oncandidatechange(i, j, k)
+
+        def onkey(self, event):
+                ### handle keyboard input for the selected cell
+                if self.selected is None: return
+                (i, j) = self.selected
+                moves = {'Up': (-1,0), 'Down': (1,0), 'Left': (0,-1), 'Right': (0,1), 'Tab': (0,1), 'Return': (1,0)}
+                if event.keysym in moves:
+                        (di, dj) = moves[event.keysym]
+                        self.select(min(max(i+di,0),self.nrows-1), min(max(j+dj,0),self.ncols-1))
+                        return 'break'
+                text = self.texts[self.mode][i][j]
+                if event.keysym=='BackSpace': text = text[:-1]
+                elif event.keysym=='Delete': text = ''
+                elif( event.char!='' and (event.char.isdigit() or event.char=='_') ):
+                        # (layout values can have multiple digits, digit grid values only one)
+                        if( self.mode=='L' and not self.replacetext ): text = (text+event.char)[-3:]
+                        else: text = event.char
+                        self.replacetext = False
+                else: return
+                self.texts[self.mode][i][j] = text
+                self.foregrounds[self.mode][i][j] = 'black'
+                self.markdirty(i, j)
+                if( self.mode=='G' and self.oncellchange is not None ): self.oncellchange(i, j)
+                return 'break'
+
+class CanvasCell:
+        ### Entry-like access to a single cell of a SuguruCanvas
+        # (supports the subset of the Tk Entry interface used by SuguruSolverGUI)
+
+        def __init__(self, canvas, mode, i, j):
+                self.canvas = canvas
+                self.mode = mode
+                self.i = i
+                self.j = j
+
+        def get(self):
+                return self.canvas.texts[self.mode][self.i][self.j]
+
+        def settext(self, text):
+                self.canvas.texts[self.mode][self.i][self.j] = text
+                if self.canvas.mode==self.mode: self.canvas.markdirty(self.i, self.j)
+
+        def insert(self, index, text):
+                current = self.get()
+                if index==tk.END: index = len(current)
+                self.settext(current[:index]+text+current[index:])
+
+        def delete(self, first, last=None):
+                current = self.get()
+                if last is None: last = first+1
+                if last==tk.END: last = len(current)
+                self.settext(current[:first]+current[last:])
+
+        def config(self, options=None, **kwargs):
+                options = dict(options if options is not None else {}, **kwargs)
+                if 'background' in options: self.canvas.backgrounds[self.mode][self.i][self.j] = options['background']
+                if 'foreground' in options: self.canvas.foregrounds[self.mode][self.i][self.j] = options['foreground']
+                if self.canvas.mode==self.mode: self.canvas.markdirty(self.i, self.j)
+
+        def focus(self):
+                self.canvas.select(self.i, self.j)
+
+class CanvasCandidate:
+        ### IntVar-like access to a single candidate of a cell of a SuguruCanvas
+        # (1 if the candidate is allowed, 0 if it is removed)
+
+        def __init__(self, canvas, i, j, k):
+                self.canvas = canvas
+                self.i = i
+                self.j = j
+                self.k = k
+
+        def get(self):
+                return int(self.canvas.candidates[self.i,self.j,self.k])
+
+        def set(self, value):
+                value = bool(value)
+                if value==self.canvas.candidates[self.i,self.j,self.k]: return
+                self.canvas.candidates[self.i,self.j,self.k] = value
+                self.canvas.markdirty(self.i, self.j)
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+
+# Nearest-centroid classifier for the digits 1 to 9 in suguru cells.
+# Each cell image is reduced to a small fixed-size feature vector
+# (the bounding box of the digit, centered in a square and downsampled),
+# which is compared to a bundled matrix of centroids.
+# The centroids are trained offline (on rendered digits and the example images)
+# by running this module:
+# python3 src/SuguruDigitClassifier.py
+
+# imports
+import os
+import numpy as np
+# note: cv2 is imported only in the functions that need it (see SuguruImageReader)
+
+
+# size (in pixels per side) of the downsampled digit used as feature vector
+featuresize = 12
+
+# file with the bundled centroids
+centroidfile = os.path.join(os.path.abspath(os.path.dirname(__file__)), '../res/digitcentroids.npz')
+
+# cache for the centroids (filled by loadcentroids)
+centroidcache = {}
+
+
+def digitfeatures(imgcell):
+	### make the feature vector of a binarized cell image
+	# the digit is taken to be the largest connected structure in the cell,
+	# which makes the features insensitive to small specks and remnants of grid lines.
+	# input arguments:
+	# - imgcell: 2D numpy uint8 array with 1 for dark and 0 for light pixels
+	# returns:
+	# 1D numpy float32 array of length featuresize**2 with unit norm
+	# (all zeros if the cell is empty)
+	import cv2
+	features = np.zeros(featuresize**2, dtype=np.float32)
+	imgcell = np.ascontiguousarray(imgcell, dtype=np.uint8)
+	(nlabels, labels, stats, _) = cv2.connectedComponentsWithStats(imgcell, connectivity=8)
+	if nlabels<2: return features
+	label = 1+np.argmax(stats[1:,cv2.CC_STAT_AREA])
+	(left, top, width, height) = stats[label,:4]
+	digit = (labels[top:top+height, left:left+width]==label).astype(np.float32)
+	# center the digit in a square (keeping the aspect ratio) and downsample
+	size = max(width, height)
+	square = np.zeros((size,size), dtype=np.float32)
+	square[(size-height)//2:(size-height)//2+height, (size-width)//2:(size-width)//2+width] = digit
+	if size!=featuresize:
+		interpolation = cv2.INTER_AREA if size>featuresize else cv2.INTER_LINEAR
+		square = cv2.resize(square, (featuresize,featuresize), interpolation=interpolation)
+	features[:] = square.flatten()
+	norm = np.linalg.norm(features)
+	if norm>0: features /= norm
+	return features
+
+
+def loadcentroids(centroidfile=centroidfile):
+	### load the bundled centroids (cached after the first call)
+	# returns:
+	# tuple of (2D float32 array with one centroid per row, 1D int array with the digit of each centroid)
+	if centroidfile not in centroidcache:
+		if not os.path.exists(centroidfile):
+			msg = 'ERROR in loadcentroids:'
+			msg += ' centroid file {} not found;'.format(centroidfile)
+			msg += ' run SuguruDigitClassifier.py to create it.'
+			raise Exception(msg)
+		with np.load(centroidfile) as f:
+			centroidcache[centroidfile] = (f['centroids'].astype(np.float32), f['digits'].astype(int))
+	return centroidcache[centroidfile]
+
+
+def classifydigits(features, centroids=None, digits=None):
+	### classify a batch of feature vectors by their nearest centroid
+	# input arguments:
+	# - features: 2D numpy array with one feature vector (see digitfeatures) per row
+	# - centroids and digits: see loadcentroids (default: the bundled centroids)
+	# returns:
+	# 1D numpy int array with the digit for each row of features
+	if centroids is None: (centroids, digits) = loadcentroids()
+	features = np.asarray(features, dtype=np.float32)
+	if len(features)==0: return np.zeros(0, dtype=int)
+	# squared euclidean distances, up to the constant norm of the features
+	distances = np.sum(centroids**2, axis=1) - 2*np.matmul(features, centroids.T)
+	return digits[np.argmin(distances, axis=1)]
+
+
+def renderdigits(digit, cellsize=64):
+	### render a digit in a number of fonts, stroke widths and small rotations
+	# (the fonts are the TrueType fonts shipped with matplotlib)
+	# input arguments:
+	# - digit: digit to render
+	# - cellsize: size (in pixels per side) of the rendered cells
+	# returns:
+	# dict matching font names to lists of binarized cell images
+	import cv2
+	import matplotlib
+	from matplotlib.textpath import TextPath
+	from matplotlib.font_manager import FontProperties
+	fontdir = os.path.join(matplotlib.get_data_path(), 'fonts', 'ttf')
+	fonts = ['DejaVuSans', 'DejaVuSans-Bold', 'DejaVuSansMono', 'DejaVuSerif',
+	         'STIXGeneral', 'STIXGeneralBol', 'cmss10', 'cmr10']
+	rendered = {}
+	for font in fonts:
+		rendered[font] = []
+		prop = FontProperties(fname=os.path.join(fontdir, font+'.ttf'))
+		path = TextPath((0,0), str(digit), size=1, prop=prop)
+		vertices = path.vertices
+		(xmin, ymin) = vertices.min(axis=0)
+		(xmax, ymax) = vertices.max(axis=0)
+		# scale the digit to half of the cell height and center it
+		scale = cellsize/2/(ymax-ymin)
+		for angle in [-4,0,4]:
+			rotation = cv2.getRotationMatrix2D(((xmin+xmax)/2*scale, (ymin+ymax)/2*scale), angle, 1)
+			polygons = []
+			for polygon in path.to_polygons():
+				polygon = polygon*scale
+				polygon = np.matmul(polygon, rotation[:,:2].T) + rotation[:,2]
+				# (flip the y-axis, as image rows go down)
+				polygon[:,0] += cellsize/2-(xmin+xmax)/2*scale
+				polygon[:,1] = cellsize/2+(ymin+ymax)/2*scale-polygon[:,1]
+				polygons.append(np.round(polygon).astype(np.int32))
+			imgcell = np.zeros((cellsize,cellsize), dtype=np.uint8)
+			cv2.fillPoly(imgcell, polygons, 1)
+			# vary the stroke width
+			kernel = np.ones((3,3), dtype=np.uint8)
+			rendered[font].append(cv2.erode(imgcell, kernel))
+			rendered[font].append(imgcell)
+			rendered[font].append(cv2.dilate(imgcell, kernel))
+	return rendered
+
+
+# digits in the example images (used as additional training data)
+exampledigits = {
+  'example_1.png': [[1,0,0,5,0],
+                    [0,0,0,0,0],
+                    [1,0,2,0,4],
+                    [0,0,0,0,0],
+                    [0,3,0,0,0]],
+  'example_2.png': [[0,0,5,0,2,0],
+                    [1,0,3,1,0,0],
+                    [0,0,0,0,2,0],
+                    [0,0,0,5,0,0],
+                    [1,0,0,0,0,0],
+                    [5,3,0,2,0,2]],
+}
+
+
+def exampledigitcells():
+	### read the digit cells from the example images listed in exampledigits
+	# returns:
+	# dict matching digits to lists of binarized cell images
+	from SuguruImageReader import SuguruImageReader
+	abspath = os.path.abspath(os.path.dirname(__file__))
+	cells = {}
+	for imagefile, digits in exampledigits.items():
+		reader = SuguruImageReader()
+		reader.loadimage(os.path.join(abspath, '../images', imagefile))
+		(horlines, verlines) = reader.findgridlines()
+		margin = int((horlines[1]-horlines[0])/10)
+		for i, row in enumerate(digits):
+			for j, digit in enumerate(row):
+				if digit==0: continue
+				imgcell = reader.image[horlines[i]+margin:horlines[i+1]-margin, verlines[j]+margin:verlines[j+1]-margin]
+				if digit not in cells: cells[digit] = []
+				cells[digit].append(imgcell)
+	return cells
+
+
+def traincentroids(templatedigits=[1,2,3,4,5]):
+	### train the centroids
+	# the training data consists of rendered digits (one centroid per digit and per font),
+	# the digit templates in the res folder (one centroid per template)
+	# and the digits in the example images (one centroid per digit).
+	# input arguments:
+	# - templatedigits: digits for which a template image res/number_<digit>.png exists
+	# returns:
+	# tuple of (centroids, digits) (see loadcentroids)
+	import cv2
+	centroids = []
+	digits = []
+	for digit in range(1,10):
+		for font, imgcells in renderdigits(digit).items():
+			features = np.array([digitfeatures(imgcell) for imgcell in imgcells])
+			centroids.append(np.mean(features, axis=0))
+			digits.append(digit)
+	abspath = os.path.abspath(os.path.dirname(__file__))
+	for digit in templatedigits:
+		dimage = os.path.join(abspath, '../res/number_{}.png'.format(digit))
+		darray = cv2.imread(dimage, cv2.IMREAD_GRAYSCALE)
+		darray = (darray<=128).astype(np.uint8)
+		centroids.append(digitfeatures(darray))
+		digits.append(digit)
+	for digit, imgcells in exampledigitcells().items():
+		features = np.array([digitfeatures(imgcell) for imgcell in imgcells])
+		centroids.append(np.mean(features, axis=0))
+		digits.append(digit)
+	return (np.array(centroids, dtype=np.float32), np.array(digits, dtype=np.uint8))
+
+
+if __name__=='__main__':
+	# train the centroids and write them to the bundled centroid file
+
+	(centroids, digits) = traincentroids()
+	np.savez_compressed(centroidfile, centroids=centroids, digits=digits)
+	print('Wrote {} centroids to {}'.format(len(centroids), os.path.normpath(centroidfile)))
+
+	# check the training accuracy on the rendered digits
+	ncorrect = 0
+	ntotal = 0
+	for digit in range(1,10):
+		for font, imgcells in renderdigits(digit).items():
+			features = np.array([digitfeatures(imgcell) for imgcell in imgcells])
+			predictions = classifydigits(features, centroids=centroids, digits=digits)
+			ncorrect += np.sum(predictions==digit)
+			ntotal += len(predictions)
+	print('Accuracy on rendered digits: {}/{}'.format(ncorrect, ntotal))
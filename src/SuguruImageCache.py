@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+# imports
+import os
+import json
+import hashlib
+import numpy as np
+
+
+# version of the cache entries
+# (to be increased whenever the image reading changes in a way that affects its results,
+#  so that old entries are no longer used)
+cacheversion = 1
+
+# default cache directory
+defaultcachedir = os.path.join(os.path.expanduser('~'), '.cache', 'SuguruSolver')
+
+
+def filehash(filename, blocksize=1<<20):
+	### get the sha256 hash of the content of a file
+	sha = hashlib.sha256()
+	with open(filename, 'rb') as f:
+		for block in iter(lambda: f.read(blocksize), b''): sha.update(block)
+	return sha.hexdigest()
+
+
+class SuguruImageCache(object):
+	### on-disk cache for the results of reading a suguru from an image
+	# the entries are keyed by the content of the image file and the reader parameters,
+	# so renaming or moving an image does not invalidate its entry, but editing it does.
+	# each entry holds the gridlines, layout and digit grid in a small npz file.
+	# the number of entries is bounded; when it is exceeded,
+	# the least recently used entries are removed.
+
+	def __init__(self, cachedir=None, maxentries=256):
+		### initializer
+		# input arguments:
+		# - cachedir: directory to store the cache entries in (default: ~/.cache/SuguruSolver)
+		# - maxentries: maximum number of entries to keep
+		if cachedir is None: cachedir = defaultcachedir
+		self.cachedir = cachedir
+		self.maxentries = maxentries
+
+	def makekey(self, imagefile, parameters):
+		### make the key for an image file and a dict of reader parameters
+		sha = hashlib.sha256()
+		sha.update(filehash(imagefile).encode())
+		sha.update(json.dumps(parameters, sort_keys=True).encode())
+		sha.update(str(cacheversion).encode())
+		return sha.hexdigest()
+
+	def entryfile(self, key):
+		### get the file holding the entry for a key
+		return os.path.join(self.cachedir, key+'.npz')
+
+	def get(self, key):
+		### get the entry for a key
+		# returns:
+		# tuple of (gridlines, layout, grid) (see SuguruImageReader),
+		# or None if there is no (readable) entry for the key
+		entryfile = self.entryfile(key)
+		try:
+			with np.load(entryfile) as f:
+				gridlines = ([int(x) for x in f['horlines']], [int(x) for x in f['verlines']])
+				layout = f['layout']
+				grid = f['grid']
+		except FileNotFoundError: return None
+		except Exception:
+			# corrupt entry, remove it
+			self.remove(key)
+			return None
+		# mark the entry as recently used
+		try: os.utime(entryfile)
+		except OSError: pass
+		return (gridlines, layout, grid)
+
+	def put(self, key, gridlines, layout, grid):
+		### store an entry for a key, and remove the least recently used entries if needed
+		if not os.path.exists(self.cachedir): os.makedirs(self.cachedir, exist_ok=True)
+		entryfile = self.entryfile(key)
+		# write to a temporary file first, so that readers never see a partial entry
+		# (also when several processes share the cache)
+		tmpfile = '{}.{}.tmp'.format(entryfile, os.getpid())
+		with open(tmpfile, 'wb') as f:
+			np.savez(f, horlines=np.array(gridlines[0], dtype=int), verlines=np.array(gridlines[1], dtype=int),
+			         layout=np.array(layout), grid=np.array(grid))
+		os.replace(tmpfile, entryfile)
+		self.evict()
+
+	def remove(self, key):
+		### remove the entry for a key (if any)
+		try: os.remove(self.entryfile(key))
+		except OSError: pass
+
+	def entries(self):
+		### get a list of (last usage time, key) for all entries, sorted from old to new
+		if not os.path.exists(self.cachedir): return []
+		entries = []
+		for filename in os.listdir(self.cachedir):
+			if not filename.endswith('.npz'): continue
+			try: mtime = os.path.getmtime(os.path.join(self.cachedir, filename))
+			except OSError: continue
+			entries.append((mtime, filename[:-len('.npz')]))
+		return sorted(entries)
+
+	def evict(self):
+		### remove the least recently used entries until there are at most maxentries left
+		entries = self.entries()
+		for (_, key) in entries[:max(0, len(entries)-self.maxentries)]: self.remove(key)
+
+	def clear(self):
+		### remove all entries
+		for (_, key) in self.entries(): self.remove(key)
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+
+# imports
+import os
+import io
+import json
+import argparse
+import contextlib
+import multiprocessing as mp
+import numpy as np
+from Suguru import Suguru
+from SuguruImageReader import SuguruImageReader
+from SuguruImageCache import SuguruImageCache
+
+
+# file extensions recognized as images when reading a directory
+imageextensions = ['.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff']
+
+
+def listimages(images):
+	### get a list of image files
+	# input arguments:
+	# - images: path to a directory (all images in it are used, sorted by name),
+	#   or list of paths to image files
+	if isinstance(images, str):
+		if not os.path.isdir(images):
+			msg = 'ERROR in listimages:'
+			msg += ' {} is not a directory.'.format(images)
+			raise Exception(msg)
+		imagefiles = sorted(os.listdir(images))
+		imagefiles = [f for f in imagefiles if os.path.splitext(f)[1].lower() in imageextensions]
+		return [os.path.join(images, f) for f in imagefiles]
+	return list(images)
+
+
+def readimage(task):
+	### read a single image (without plotting) and optionally solve it
+	# input arguments:
+	# - task: tuple of (image file, dict with options, see readimages)
+	# returns:
+	# dict with the image file and either the layout and grid (and solution if requested),
+	# or an error message and the stage at which the error occurred
+	(imagefile, options) = task
+	record = {'image': imagefile}
+	stage = 'loadimage'
+	try:
+		# silence the printouts of the reader
+		with contextlib.redirect_stdout(io.StringIO()):
+			reader = SuguruImageReader()
+			reader.loadimage(imagefile, targetsize=options['targetsize'], lazy=True)
+			# check the cache (if any)
+			cache = None
+			entry = None
+			if options['cachedir'] is not None:
+				cache = SuguruImageCache(options['cachedir'])
+				parameters = dict(reader.loadoptions, nprobes=options['nprobes'], threshold=options['threshold'])
+				key = cache.makekey(imagefile, parameters)
+				entry = cache.get(key)
+			if entry is not None: (reader.gridlines, reader.layout, reader.grid) = entry
+			else:
+				reader.decodeimage()
+				stage = 'findgridlines'
+				reader.findgridlines(nprobes=options['nprobes'], threshold=options['threshold'])
+				stage = 'finddigits'
+				reader.finddigits(doplot=False)
+				stage = 'findlayout'
+				reader.findlayout(doplot=False)
+				if cache is not None: cache.put(key, reader.gridlines, reader.layout, reader.grid)
+			record['layout'] = reader.layout.tolist()
+			record['grid'] = reader.grid.tolist()
+			if options['solve']:
+				stage = 'solve'
+				suguru = Suguru()
+				suguru.initfromgrids(reader.layout, reader.grid)
+				(resultcode, resultmessage) = suguru.solve(search=options['search'])
+				record['resultcode'] = resultcode
+				record['resultmessage'] = resultmessage
+				record['solution'] = suguru.grid.tolist()
+	except Exception as e:
+		return {'image': imagefile, 'error': str(e), 'stage': stage}
+	return record
+
+
+def writerecord(record, outputformat, output):
+	### write a record produced by readimage
+	# input arguments:
+	# - record: dict produced by readimage
+	# - outputformat: either 'jsonl' or 'txt'
+	# - output: open file object for 'jsonl', output directory for 'txt'
+	#   (in the latter case, each image gives a txt file in the Suguru.savetotxt format,
+	#    plus a second one with the solution if available;
+	#    errors are appended to errors.jsonl in the same directory)
+	if outputformat=='jsonl':
+		output.write(json.dumps(record)+'\n')
+		output.flush()
+		return
+	if 'error' in record:
+		with open(os.path.join(output, 'errors.jsonl'), 'a') as f:
+			f.write(json.dumps(record)+'\n')
+		return
+	basename = os.path.splitext(os.path.basename(record['image']))[0]
+	suguru = Suguru()
+	suguru.initfromgrids(np.array(record['layout']), np.array(record['grid']))
+	suguru.savetotxt(os.path.join(output, basename+'.txt'))
+	if 'solution' in record:
+		suguru.initfromgrid(np.array(record['solution']))
+		suguru.savetotxt(os.path.join(output, basename+'_solution.txt'))
+
+
+def readimages(images, output, outputformat='jsonl', solve=False, search=False,
+               nprocesses=None, chunksize=1,
+               targetsize=None, nprobes=7, threshold=0.8, cachedir=None):
+	### read a batch of images in a pool of worker processes
+	# the results are written as soon as they are available (in input order).
+	# input arguments:
+	# - images: directory or list of image files (see listimages)
+	# - output: output file for 'jsonl' format, output directory for 'txt' format
+	# - outputformat: either 'jsonl' or 'txt' (see writerecord)
+	# - solve: whether to solve the suguru after reading it
+	# - search: whether to use search when solving (see Suguru.solve)
+	# - nprocesses: number of worker processes (default: number of cpus)
+	# - chunksize: number of images sent to a worker process at once
+	# - targetsize: see SuguruImageReader.loadimage
+	# - nprobes and threshold: see SuguruImageReader.findgridlines
+	# - cachedir: directory of a SuguruImageCache shared by all worker processes
+	#   (default: no cache; images with an entry in the cache are not processed again)
+	# returns:
+	# tuple of (number of images read successfully, number of images with errors)
+	if outputformat not in ['jsonl', 'txt']:
+		msg = 'ERROR in readimages:'
+		msg += ' output format {} not recognized.'.format(outputformat)
+		raise Exception(msg)
+	imagefiles = listimages(images)
+	options = {'targetsize': targetsize, 'nprobes': nprobes, 'threshold': threshold,
+	           'solve': solve, 'search': search, 'cachedir': cachedir}
+	tasks = [(imagefile, options) for imagefile in imagefiles]
+	nsuccess = 0
+	nerrors = 0
+	if outputformat=='txt':
+		if not os.path.exists(output): os.makedirs(output)
+		outputfile = None
+	else: outputfile = open(output, 'w')
+	try:
+		with mp.Pool(processes=nprocesses) as pool:
+			for record in pool.imap(readimage, tasks, chunksize=chunksize):
+				writerecord(record, outputformat, outputfile if outputfile is not None else output)
+				if 'error' in record: nerrors += 1
+				else: nsuccess += 1
+	finally:
+		if outputfile is not None: outputfile.close()
+	return (nsuccess, nerrors)
+
+
+if __name__=='__main__':
+
+	parser = argparse.ArgumentParser(description='Read a batch of suguru images')
+	parser.add_argument('images', nargs='+',
+	                    help='Directory with images, or list of image files')
+	parser.add_argument('-o', '--output', required=True,
+	                    help='Output file (jsonl format) or directory (txt format)')
+	parser.add_argument('-f', '--format', default='jsonl', choices=['jsonl', 'txt'])
+	parser.add_argument('-s', '--solve', action='store_true',
+	                    help='Solve the sugurus after reading them')
+	parser.add_argument('--search', action='store_true',
+	                    help='Use search when solving')
+	parser.add_argument('-n', '--nprocesses', type=int, default=None)
+	parser.add_argument('--chunksize', type=int, default=1)
+	parser.add_argument('--cache', default=None,
+	                    help='Directory of a cache for the reading results (default: no cache)')
+	args = parser.parse_args()
+
+	images = args.images[0] if( len(args.images)==1 and os.path.isdir(args.images[0]) ) else args.images
+	(nsuccess, nerrors) = readimages(images, args.output, outputformat=args.format,
+	                                 solve=args.solve, search=args.search,
+	                                 nprocesses=args.nprocesses, chunksize=args.chunksize,
+	                                 cachedir=args.cache)
+	print('Read {} images successfully, {} images with errors.'.format(nsuccess, nerrors))
@@ -2,11 +2,12 @@
 
 # imports
 import os
+import threading
+from collections import deque
 import numpy as np
-import cv2
-from sklearn.cluster import KMeans
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
+from SuguruDigitClassifier import digitfeatures, classifydigits
+# note: cv2 and matplotlib are imported only in the functions that need them,
+#       to keep importing this module (e.g. for the GUI or batch processing) fast
 
 
 class SuguruImageReader(object):
@@ -18,29 +19,84 @@ class SuguruImageReader(object):
 	# - digital written numbers
 	
 	def __init__(self):
-		self.image = None
+		self.imagefile = None
+		self.loadoptions = None
+		self.imagedata = None
 		self.gridlines = None
 		self.grid = None
 		self.layout = None
+		self.cachehit = False
+		# data recorded while reading, for making diagnostic plots afterwards
+		# (see plotdiagnostics)
+		self.diagnostics = {}
 	
-	def loadimage(self, imagefile, targetsize=None):
+	@property
+	def image(self):
+		### currently loaded image
+		# (if the image was loaded lazily, it is decoded on first use)
+		if( self.imagedata is None and self.imagefile is not None ): self.decodeimage()
+		return self.imagedata
+	
+	@image.setter
+	def image(self, image):
+		self.imagedata = image
+	
+	def loadimage(self, imagefile, targetsize=None, targetcellsize=None, minlinewidth=2, lazy=False):
 		### load an image and perform preprocessing.
 		# preprocessing includes:
-		# - convert to 2D grayscale array
+		# - decoding to a 2D grayscale numpy uint8 array
+		# - cropping to the grid and downscaling (optional, for large images)
+		# - resizing (optional)
 		# - project values to 0 or 1
 		#   (note: high values = white will be projected to 0,
 		#    low values = black will be projected to 1!)
-		# - type conversion to numpy uint8
-		# - resizing (optional)
-		self.image = cv2.imread(imagefile)
-		self.image = cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY)
-		self.image = np.where(self.image>128,0,1)
-		self.image = self.image.astype(np.uint8)
+		# input arguments:
+		# - targetsize: tuple of (width, height) to resize the image to
+		# - targetcellsize: if provided, the image is cropped to the bounding box of the grid
+		#   and downscaled by an integer factor to approximately this cell size (in pixels)
+		#   (useful for high-resolution scans)
+		# - minlinewidth: when downscaling, keep the thinnest grid lines at least this wide
+		# - lazy: if True, the image is only decoded when it is first used
+		#   (e.g. not at all if findsuguru finds the results in a cache)
+		self.imagefile = imagefile
+		self.loadoptions = {'targetsize': targetsize, 'targetcellsize': targetcellsize,
+		                    'minlinewidth': minlinewidth}
+		self.imagedata = None
+		self.gridlines = None
+		self.grid = None
+		self.layout = None
+		self.cachehit = False
+		self.diagnostics = {}
+		if not lazy: self.decodeimage()
+	
+	def decodeimage(self):
+		### decode and preprocess the image file set in loadimage
+		import cv2
+		imagefile = self.imagefile
+		targetsize = self.loadoptions['targetsize']
+		targetcellsize = self.loadoptions['targetcellsize']
+		minlinewidth = self.loadoptions['minlinewidth']
+		image = cv2.imread(imagefile, cv2.IMREAD_GRAYSCALE)
+		if image is None:
+			msg = 'ERROR in SuguruImageReader.decodeimage:'
+			msg += ' could not read image {}'.format(imagefile)
+			raise Exception(msg)
 		print('Loaded image {}'.format(imagefile))
+		if targetcellsize is not None:
+			(ymin, ymax, xmin, xmax) = findgridbox(image)
+			image = image[ymin:ymax, xmin:xmax]
+			(cellsize, linewidth) = measuregrid(image)
+			# (keep the darkest pixel of each block, so that thin lines are not washed out)
+			factor = int(min(cellsize/targetcellsize, linewidth/minlinewidth))
+			if factor>1: image = minpool(image, factor)
+			else: image = np.ascontiguousarray(image)
+			print('Cropped and scaled image to size {}'.format(image.shape[::-1]))
 		if targetsize is not None:
-			self.image = cv2.resize(self.image, targetsize)
-			self.image = np.where(self.image>128,0,1)
+			image = cv2.resize(image, targetsize)
 			print('Converted image to size {}'.format(targetsize))
+		# binarize in place
+		cv2.threshold(image, 128, 1, cv2.THRESH_BINARY_INV, dst=image)
+		self.imagedata = image
 	
 	def layoutimage(self):
 		### get currently loaded image, but only line structures
@@ -73,20 +129,26 @@ class SuguruImageReader(object):
 				dselfimage[horlines[i]+margin:horlines[i+1]-margin, verlines[j]+margin:verlines[j+1]-margin] = fragment
 		return dselfimage
 		
-	def drawimage(self, doplot=True, onlylayout=False, onlydigits=False, invert=True, title=None, ticks=False):
+	def drawimage(self, doplot=True, onlylayout=False, onlydigits=False, invert=True, title=None, ticks=False,
+	              offscreen=False):
 		### draw the currently loaded image for visual inspection
+		# input arguments:
+		# - offscreen: if True, draw on a figure that is not managed by pyplot
+		#   (it is never shown, but can be saved to a file, also from a background thread)
 		if self.image is None: raise Exception('Current image is None')
 		image = np.copy(self.image)
 		if onlylayout: image = self.layoutimage()
 		if onlydigits: image = self.digitimage()
 		if invert: image = np.where(image>0.5,0,1)
-		(fig,ax) = plt.subplots()
+		(fig,ax) = newfigure(offscreen=offscreen)
 		ax.imshow(image, cmap='gray')
 		if title is not None: ax.set_title(title)
 		if not ticks:
 			ax.set_xticks([])
 			ax.set_yticks([])
-		if doplot: plt.show(block=False)
+		if( doplot and not offscreen ):
+			import matplotlib.pyplot as plt
+			plt.show(block=False)
 		return (fig,ax)	
 		
 	def findgridlines(self, nprobes=7, threshold=0.8, doplot=False):
@@ -104,102 +166,118 @@ class SuguruImageReader(object):
 		# reduce lines of non-unitiy thickness to single lines
 		filtered_horlines = reduceinds(horlines, threshold=3)
 		filtered_verlines = reduceinds(verlines, threshold=3)
-		gridlines = (filtered_horlines, filtered_verlines)
-		# make plots
-		if doplot:
-			(fig,ax) = self.drawimage(doplot=False)
-			# draw all lines
-			thickness = 2
-			color = 'r'
-			style = '--'
-			plt.autoscale(enable=False)
-			xmin = 0
-			xmax = self.image.shape[1]
-			for y in gridlines[0]:
-				ax.plot([xmin, xmax], [y, y], linewidth=thickness, color=color, linestyle=style)
-			ymin = 0
-			ymax = self.image.shape[0]
-			for x in gridlines[1]:
-				ax.plot([x, x], [ymin, ymax], linewidth=thickness, color=color, linestyle=style)
-			ax.set_title('Image with reconstructed grid lines')
 		# set and return the result
+		# (the diagnostics of later steps are no longer valid)
 		self.gridlines = (filtered_horlines, filtered_verlines)
+		self.diagnostics = {}
+		if doplot: self.plotgridlines()
 		return self.gridlines
 	
-	def findlayout(self, doplot=True):
-		### find the layout of the grid by checking line thickness
+	def plotgridlines(self, offscreen=False):
+		### make a plot of the image with the grid lines found by findgridlines
+		if self.gridlines is None: raise Exception('Current gridlines is None')
+		(fig,ax) = self.drawimage(doplot=False, offscreen=offscreen)
+		# draw all lines
+		thickness = 2
+		color = 'r'
+		style = '--'
+		ax.autoscale(enable=False)
+		xmin = 0
+		xmax = self.image.shape[1]
+		for y in self.gridlines[0]:
+			ax.plot([xmin, xmax], [y, y], linewidth=thickness, color=color, linestyle=style)
+		ymin = 0
+		ymax = self.image.shape[0]
+		for x in self.gridlines[1]:
+			ax.plot([x, x], [ymin, ymax], linewidth=thickness, color=color, linestyle=style)
+		ax.set_title('Image with reconstructed grid lines')
+		return (fig,ax)
+	
+	def measureedges(self):
+		### measure the thickness of all inner edges of the grid
 		# returns:
-		# numpy grid with layout
+		# dict with the thicknesses of horizontal and vertical edges ('horedges' and 'veredges')
+		# and their positions (for plotting)
 		if self.image is None: raise Exception('Current image is None')
 		if self.gridlines is None: raise Exception('Current gridlines is None')
 		horlines = self.gridlines[0]
 		verlines = self.gridlines[1]
-		nrows = len(horlines)-1
-		ncols = len(verlines)-1
 		# make grids of edge thicknesses
+		# (sample a strip of 2*halfwidth pixels across each inner edge, at the cell centers)
 		halfwidth = int((horlines[1]-horlines[0])/10)
-		horedges = np.zeros((nrows-1,ncols))
-		for j in range(ncols):
-			xcoord = int((verlines[j]+verlines[j+1])/2.)
-			for i in range(nrows-1):
-				ycoord = horlines[i+1]
-				section = self.image[ycoord-halfwidth:ycoord+halfwidth,xcoord]
-				horedges[i,j] = np.sum(section)
-		veredges = np.zeros((nrows,ncols-1))
-		for i in range(nrows):
-			ycoord = int((horlines[i]+horlines[i+1])/2.)
-			for j in range(ncols-1):
-				xcoord = verlines[j+1]
-				section = self.image[ycoord,xcoord-halfwidth:xcoord+halfwidth]
-				veredges[i,j] = np.sum(section)
+		offsets = np.arange(-halfwidth, halfwidth)
+		xcenters = ((np.array(verlines[:-1])+np.array(verlines[1:]))/2.).astype(int)
+		ycenters = ((np.array(horlines[:-1])+np.array(horlines[1:]))/2.).astype(int)
+		xedges = np.array(verlines[1:-1], dtype=int)
+		yedges = np.array(horlines[1:-1], dtype=int)
+		horsamples = self.image[(yedges[:,np.newaxis]+offsets)[:,:,np.newaxis], xcenters[np.newaxis,np.newaxis,:]]
+		horedges = np.sum(horsamples, axis=1, dtype=float)
+		versamples = self.image[ycenters[:,np.newaxis,np.newaxis], (xedges[:,np.newaxis]+offsets)[np.newaxis,:,:]]
+		veredges = np.sum(versamples, axis=2, dtype=float)
+		return {'horedges': horedges, 'veredges': veredges, 'halfwidth': halfwidth,
+		        'xcenters': xcenters, 'ycenters': ycenters, 'xedges': xedges, 'yedges': yedges}
+	
+	def findlayout(self, doplot=True):
+		### find the layout of the grid by checking line thickness
+		# returns:
+		# numpy grid with layout
+		edgedata = self.measureedges()
+		horedges = edgedata['horedges']
+		veredges = edgedata['veredges']
+		(nrows, ncols) = (len(self.gridlines[0])-1, len(self.gridlines[1])-1)
 		# find thickness threshold
-		widths = np.array(list(horedges.flatten()) + list(veredges.flatten()))
-		threshold = findthreshold(widths, doplot=doplot)
-		# make a plot with edge thicknesses
-		if doplot:
-			(fig,ax) = self.drawimage(doplot=False, onlylayout=True)
-			# write thickness of horizontal lines
-			for j in range(ncols):
-				xcoord = int((verlines[j]+verlines[j+1])/2.)
-				for i in range(nrows-1):
-					ycoord = horlines[i+1]
-					value = int(horedges[i,j])
-					color = 'r' if value>threshold else 'g'
-					ax.text(xcoord, ycoord-halfwidth, str(value), color=color,
-					  horizontalalignment='center')
-			# write thickness of vertical lines
-			for i in range(nrows):
-				ycoord = int((horlines[i]+horlines[i+1])/2.)
-				for j in range(ncols-1):
-					xcoord = verlines[j+1]
-					value = int(veredges[i,j])
-					color = 'r' if value>threshold else 'g'
-					ax.text(xcoord+halfwidth, ycoord, str(value), color=color,
-					 verticalalignment='center')
-			ax.set_title('Reconstructed line thickness')
+		widths = np.concatenate((horedges.flatten(), veredges.flatten()))
+		threshold = findthreshold(widths)
+		edgedata['threshold'] = threshold
+		self.diagnostics['edges'] = edgedata
 		# make edge structure
-		edges = np.zeros((nrows,ncols,4))
-		for i in range(nrows):
-			for j in range(ncols):
-				upedge = 1
-				if( i>0 and horedges[i-1,j]<threshold ): upedge = 0
-				rightedge = 1
-				if( j<ncols-1 and veredges[i,j]<threshold ): rightedge = 0
-				lowedge = 1
-				if( i<nrows-1 and horedges[i,j]<threshold ): lowedge = 0
-				leftedge = 1
-				if( j>0 and veredges[i,j-1]<threshold ): leftedge = 0
-				thisedges = np.array([upedge,rightedge,lowedge,leftedge])
-				edges[i,j,:] = thisedges
-				# printouts for testing
-				#print('row {}, column {}: {}'.format(i,j,thisedges))
+		# (1 for an edge, 0 for an opening, in the order up, right, down, left;
+		#  the outer border of the grid always counts as an edge)
+		edges = np.ones((nrows,ncols,4))
+		edges[1:,:,0] = (horedges>=threshold)
+		edges[:,:-1,1] = (veredges>=threshold)
+		edges[:-1,:,2] = (horedges>=threshold)
+		edges[:,1:,3] = (veredges>=threshold)
 		# fill the layout
 		layout = filllayout(edges)
 		self.layout = layout
+		if doplot:
+			_ = self.plotthreshold()
+			_ = self.plotlayout()
 		return layout
 	
-	def finddigits(self, doplot=True):
+	def plotthreshold(self, offscreen=False):
+		### make a plot of the edge thickness distribution and the threshold found by findlayout
+		if 'edges' not in self.diagnostics: _ = self.findlayout(doplot=False)
+		edgedata = self.diagnostics['edges']
+		widths = np.concatenate((edgedata['horedges'].flatten(), edgedata['veredges'].flatten()))
+		return plotthreshold(widths, twomeans([widths])[0], offscreen=offscreen)
+	
+	def plotlayout(self, offscreen=False):
+		### make a plot with the edge thicknesses found by findlayout
+		if 'edges' not in self.diagnostics: _ = self.findlayout(doplot=False)
+		edgedata = self.diagnostics['edges']
+		threshold = edgedata['threshold']
+		halfwidth = edgedata['halfwidth']
+		(fig,ax) = self.drawimage(doplot=False, onlylayout=True, offscreen=offscreen)
+		# write thickness of horizontal lines
+		for (i,j), value in np.ndenumerate(edgedata['horedges'].astype(int)):
+			color = 'r' if value>threshold else 'g'
+			ax.text(edgedata['xcenters'][j], edgedata['yedges'][i]-halfwidth, str(value), color=color,
+			  horizontalalignment='center')
+		# write thickness of vertical lines
+		for (i,j), value in np.ndenumerate(edgedata['veredges'].astype(int)):
+			color = 'r' if value>threshold else 'g'
+			ax.text(edgedata['xedges'][j]+halfwidth, edgedata['ycenters'][i], str(value), color=color,
+			 verticalalignment='center')
+		ax.set_title('Reconstructed line thickness')
+		return (fig,ax)
+	
+	def finddigits(self, doplot=True, method='centroid'):
 		### find filled digits
+		# input arguments:
+		# - method: either 'centroid' (nearest-centroid classifier for digits 1 to 9,
+		#   see SuguruDigitClassifier) or 'template' (overlap with the digit templates for 1 to 5)
 		# returns:
 		# numpy grid with digits (0 for no digit)
 		if self.image is None: raise Exception('Current image is None')
@@ -209,69 +287,254 @@ class SuguruImageReader(object):
 		nrows = len(horlines)-1
 		ncols = len(verlines)-1
 		grid = np.zeros((nrows,ncols), dtype=int)
-		# read digit images
-		dimages = []
-		for digit in [1,2,3,4,5]:
-			abspath = os.path.abspath(os.path.dirname(__file__))
-			dimage = '../res/number_{}.png'.format(digit)
-			dimage = os.path.join(abspath,dimage)
-			darray = cv2.imread(dimage)
-			darray = cv2.cvtColor(darray, cv2.COLOR_BGR2GRAY)
-			darray = np.where(darray>128,0,1)
-			darray = darray.astype(np.uint8)
-			dimages.append(darray)
-		# loop over individual cells
+		if method not in ['centroid', 'template']:
+			msg = 'ERROR in SuguruImageReader.finddigits:'
+			msg += ' method {} not recognized.'.format(method)
+			raise Exception(msg)
+		# collect the filled cells
+		# (as feature vectors for the centroid method, grouped by cell size for the template method)
 		margin = int((horlines[1]-horlines[0])/10)
+		filledcells = {}
 		for i in range(nrows):
 			for j in range(ncols):
 				imgcell = self.image[horlines[i]+margin:horlines[i+1]-margin, verlines[j]+margin:verlines[j+1]-margin]
 				fillfrac = np.sum(imgcell)/(imgcell.shape[0]*imgcell.shape[1])
 				# check if not filled
 				if fillfrac < 0.05: continue
-				# else try overlap with other digits
-				overlaps = np.zeros(5)
-				for dindex, dimage in enumerate(dimages):
-					dimage = cv2.resize(dimage, (imgcell.shape[1],imgcell.shape[0]))
-					overlaps[dindex] = np.sum(np.multiply(imgcell,dimage))
-				digit = np.argmax(overlaps)+1
-				grid[i,j] = digit
-		# make plot
-		if doplot:
-			(fig,ax) = self.drawimage(doplot=False, onlydigits=True)
-			# write thickness of horizontal lines
-			for j in range(ncols):
-				for i in range(nrows):
-					if grid[i,j]==0: continue
-					xcoord = verlines[j+1]
-					ycoord = horlines[i]
-					cellanchor = (verlines[j]+margin, horlines[i]+margin)
-					cellwidth = verlines[j+1]-verlines[j]-2*margin
-					cellheight = horlines[i+1]-horlines[i]-2*margin
-					cellbox = patches.Rectangle(cellanchor, cellwidth, cellheight, 
-								 linewidth=1, linestyle='--', edgecolor='r', facecolor='none')
-					ax.add_patch(cellbox)
-					ax.text(xcoord, ycoord, str(grid[i,j]), color='b',
-					 horizontalalignment='right', verticalalignment='top')
-			ax.set_title('Reconstructed digits')
+				key = None if method=='centroid' else imgcell.shape
+				if key not in filledcells: filledcells[key] = ([], [])
+				filledcells[key][0].append((i,j))
+				if method=='centroid': filledcells[key][1].append(digitfeatures(imgcell))
+				else: filledcells[key][1].append(imgcell.flatten())
+		for key, (cells, imgcells) in filledcells.items():
+			# classify all filled cells at once
+			if method=='centroid': digits = classifydigits(np.array(imgcells))
+			# calculate the overlap of all filled cells with all digit templates at once
+			else:
+				templates = digittemplates(key)
+				overlaps = np.matmul(np.array(imgcells, dtype=np.float32), templates.T)
+				digits = np.argmax(overlaps, axis=1)+1
+			for (i,j), digit in zip(cells, digits): grid[i,j] = digit
 		self.grid = grid
+		if doplot: _ = self.plotdigits()
 		return self.grid
 	
-	def findsuguru(self, doplot=False):
+	def plotdigits(self, offscreen=False):
+		### make a plot with the digits found by finddigits
+		import matplotlib.patches as patches
+		if self.grid is None: raise Exception('Current grid is None')
+		horlines = self.gridlines[0]
+		verlines = self.gridlines[1]
+		(nrows, ncols) = self.grid.shape
+		margin = int((horlines[1]-horlines[0])/10)
+		(fig,ax) = self.drawimage(doplot=False, onlydigits=True, offscreen=offscreen)
+		# write thickness of horizontal lines
+		for j in range(ncols):
+			for i in range(nrows):
+				if self.grid[i,j]==0: continue
+				xcoord = verlines[j+1]
+				ycoord = horlines[i]
+				cellanchor = (verlines[j]+margin, horlines[i]+margin)
+				cellwidth = verlines[j+1]-verlines[j]-2*margin
+				cellheight = horlines[i+1]-horlines[i]-2*margin
+				cellbox = patches.Rectangle(cellanchor, cellwidth, cellheight, 
+							 linewidth=1, linestyle='--', edgecolor='r', facecolor='none')
+				ax.add_patch(cellbox)
+				ax.text(xcoord, ycoord, str(self.grid[i,j]), color='b',
+				 horizontalalignment='right', verticalalignment='top')
+		ax.set_title('Reconstructed digits')
+		return (fig,ax)
+	
+	def findsuguru(self, doplot=False, nprobes=7, threshold=0.8, cache=None):
 		### summary function of all the above, reconstructing the full suguru
+		# input arguments:
+		# - nprobes and threshold: see findgridlines
+		# - doplot: if True, show the diagnostic plots (see plotdiagnostics) after reading
+		#   (note: making the plots can take much longer than the reading itself;
+		#    alternatively, call plotdiagnostics or savediagnostics later when needed)
+		# - cache: SuguruImageCache instance (optional);
+		#   if it holds the results for the loaded image file and the reader parameters,
+		#   they are used without processing (or even decoding) the image;
+		#   else the results are added to it
 		# returns:
 		# tuple of (grid array, layout array)
-		if doplot: _ = self.drawimage(title='Original image')
-		_ = self.findgridlines(doplot=doplot)
-		if doplot:
-			_ = self.drawimage(onlylayout=True, title='Layout-only image')
-			_ = self.drawimage(onlydigits=True, title='Digit-only image')
-		_ = self.finddigits(doplot=doplot)
-		_ = self.findlayout(doplot=doplot)
+		self.cachehit = False
+		if( cache is not None and self.imagefile is not None ):
+			key = cache.makekey(self.imagefile, dict(self.loadoptions, nprobes=nprobes, threshold=threshold))
+			entry = cache.get(key)
+			if entry is not None:
+				(self.gridlines, self.layout, self.grid) = entry
+				self.cachehit = True
+				print('Read results for image {} from cache'.format(self.imagefile))
+				if doplot: self.showdiagnostics()
+				return (self.grid, self.layout)
+		_ = self.findgridlines(nprobes=nprobes, threshold=threshold)
+		_ = self.finddigits(doplot=False)
+		_ = self.findlayout(doplot=False)
+		if( cache is not None and self.imagefile is not None ):
+			cache.put(key, self.gridlines, self.layout, self.grid)
+		if doplot: self.showdiagnostics()
 		return (self.grid, self.layout)
 	
+	def plotdiagnostics(self, offscreen=False):
+		### make all diagnostic plots of the reading
+		# (the data needed for the plots is recorded while reading,
+		#  or recomputed here if needed, e.g. if the results were taken from a cache)
+		# input arguments:
+		# - offscreen: see drawimage
+		# returns:
+		# list of tuples of (name, figure)
+		if self.grid is None: raise Exception('Current grid is None')
+		figures = []
+		figures.append(('original', self.drawimage(doplot=False, title='Original image', offscreen=offscreen)[0]))
+		figures.append(('gridlines', self.plotgridlines(offscreen=offscreen)[0]))
+		figures.append(('layoutimage', self.drawimage(doplot=False, onlylayout=True, title='Layout-only image',
+		                                              offscreen=offscreen)[0]))
+		figures.append(('digitimage', self.drawimage(doplot=False, onlydigits=True, title='Digit-only image',
+		                                             offscreen=offscreen)[0]))
+		figures.append(('digits', self.plotdigits(offscreen=offscreen)[0]))
+		figures.append(('threshold', self.plotthreshold(offscreen=offscreen)[0]))
+		figures.append(('linethickness', self.plotlayout(offscreen=offscreen)[0]))
+		return figures
+	
+	def showdiagnostics(self):
+		### show all diagnostic plots of the reading in interactive windows
+		import matplotlib.pyplot as plt
+		figures = self.plotdiagnostics()
+		plt.show(block=False)
+		return figures
+	
+	def savediagnostics(self, outputdir, background=False):
+		### save all diagnostic plots of the reading as png files
+		# the plots are made off-screen, so this does not need (or disturb) a display.
+		# input arguments:
+		# - outputdir: directory to save the plots in
+		#   (the file names are the image file name followed by the name of the plot)
+		# - background: if True, make the plots in a background thread
+		# returns:
+		# list of the saved files, or the background thread (if background is True)
+		if background:
+			thread = threading.Thread(target=self.savediagnostics, args=(outputdir,), daemon=True)
+			thread.start()
+			return thread
+		if not os.path.exists(outputdir): os.makedirs(outputdir, exist_ok=True)
+		basename = 'image'
+		if self.imagefile is not None: basename = os.path.splitext(os.path.basename(self.imagefile))[0]
+		files = []
+		for name, fig in self.plotdiagnostics(offscreen=True):
+			files.append(os.path.join(outputdir, '{}_{}.png'.format(basename, name)))
+			fig.savefig(files[-1])
+		return files
+	
+
+# cache for digit templates used in finddigits
+# (the key None holds the binarized templates at their original size,
+#  the other keys are cell shapes holding the resized and flattened templates)
+templatecache = {}
+
+
+def digittemplates(cellshape=None):
+	### get the binarized digit templates
+	# input arguments:
+	# - cellshape: tuple of (height, width) to resize the templates to
+	# returns:
+	# if cellshape is None, a list of 2D arrays with the templates at their original size,
+	# else a 2D float32 array with one flattened resized template per row
+	import cv2
+	if None not in templatecache:
+		abspath = os.path.abspath(os.path.dirname(__file__))
+		dimages = []
+		for digit in [1,2,3,4,5]:
+			dimage = '../res/number_{}.png'.format(digit)
+			dimage = os.path.join(abspath,dimage)
+			darray = cv2.imread(dimage)
+			darray = cv2.cvtColor(darray, cv2.COLOR_BGR2GRAY)
+			darray = np.where(darray>128,0,1)
+			darray = darray.astype(np.uint8)
+			dimages.append(darray)
+		templatecache[None] = dimages
+	if cellshape is None: return templatecache[None]
+	if cellshape not in templatecache:
+		templates = [cv2.resize(dimage, (cellshape[1],cellshape[0])).flatten()
+		             for dimage in templatecache[None]]
+		templatecache[cellshape] = np.array(templates, dtype=np.float32)
+	return templatecache[cellshape]
+
+
+def findgridbox(image, maxsize=512):
+	### find the bounding box of the grid in a grayscale image
+	# the image is first reduced to at most maxsize pixels per side,
+	# keeping the darkest pixel of each block so that thin lines are preserved.
+	# the grid is taken to be the largest connected structure of dark pixels.
+	# returns:
+	# tuple of (ymin, ymax, xmin, xmax) in pixels of the original image
+	import cv2
+	(height, width) = image.shape
+	factor = max(1, int(np.ceil(max(height,width)/maxsize)))
+	if( height<factor or width<factor ): return (0, height, 0, width)
+	small = minpool(image, factor)
+	dark = (small<=128).astype(np.uint8)
+	(nlabels, _, stats, _) = cv2.connectedComponentsWithStats(dark, connectivity=8)
+	if nlabels<2: return (0, height, 0, width)
+	label = 1+np.argmax(stats[1:,cv2.CC_STAT_AREA])
+	xmin = stats[label,cv2.CC_STAT_LEFT]
+	ymin = stats[label,cv2.CC_STAT_TOP]
+	xmax = xmin+stats[label,cv2.CC_STAT_WIDTH]
+	ymax = ymin+stats[label,cv2.CC_STAT_HEIGHT]
+	# convert to original pixels, with a margin of one block
+	ymin = max(0, (ymin-1)*factor)
+	ymax = min(height, (ymax+1)*factor)
+	xmin = max(0, (xmin-1)*factor)
+	xmax = min(width, (xmax+1)*factor)
+	return (int(ymin), int(ymax), int(xmin), int(xmax))
+
+
+def minpool(image, factor):
+	### reduce an image by an integer factor, keeping the minimum (darkest) value of each block
+	# (incomplete blocks at the bottom and right edges are dropped)
+	(height, width) = image.shape
+	nrows = height//factor
+	ncols = width//factor
+	small = image[:nrows*factor].reshape(nrows, factor, width).min(axis=1)
+	return small[:,:ncols*factor].reshape(nrows, ncols, factor).min(axis=2)
+
+
+def measuregrid(image, nprobes=7, threshold=0.8):
+	### estimate the cell size and thin line width of a grayscale grid image
+	# (only a few probe rows and columns are read, as in findgridlines;
+	#  the thin line width is a low percentile of all line widths,
+	#  to be robust against partially detected lines)
+	# returns:
+	# tuple of (cell size, line width) in pixels
+	(imgheight,imgwidth) = image.shape
+	horprobes = np.linspace(imgheight/4, imgheight*3/4, num=nprobes).astype(int)
+	verprobes = np.linspace(imgwidth/4, imgwidth*3/4, num=nprobes).astype(int)
+	horlines = (np.sum(image[:,verprobes]<=128,axis=1)/nprobes > threshold).nonzero()[0]
+	verlines = (np.sum(image[horprobes,:]<=128,axis=0)/nprobes > threshold).nonzero()[0]
+	if( len(horlines)==0 or len(verlines)==0 ):
+		msg = 'ERROR in measuregrid: no grid lines found.'
+		raise Exception(msg)
+	cellsizes = []
+	linewidths = []
+	for lines, length in [(horlines, imgheight), (verlines, imgwidth)]:
+		# (allow small gaps within lines, e.g. from noise in high-resolution scans)
+		maxgap = max(3, int(0.01*length))
+		centers = reduceinds(lines, threshold=maxgap)
+		if len(centers)>1: cellsizes.append((centers[-1]-centers[0])/(len(centers)-1))
+		# line widths are the lengths of runs of (almost) consecutive indices
+		breaks = np.nonzero(np.diff(lines)>=maxgap)[0]
+		runstarts = np.concatenate(([0], breaks+1))
+		runstops = np.concatenate((breaks, [len(lines)-1]))
+		linewidths += list(lines[runstops]-lines[runstarts]+1)
+	if len(cellsizes)==0:
+		msg = 'ERROR in measuregrid: found only a single grid line.'
+		raise Exception(msg)
+	return (min(cellsizes), np.percentile(linewidths, 25))
+
 
 def reduceinds(inds, threshold=1):
 	### reduce set of indices to mean of each subset
+	if len(inds)<2: return [int(ind) for ind in inds]
 	res = []
 	currentset = [inds[0]]
 	currentidx = 1
@@ -297,71 +560,138 @@ def filllayout(edges):
 	#   where the last dimension encodes the edges and openings
 	#   (0 for opening, 1 for edge) in the order up, right, down, left
 	# returns:
-	# array of shape (nrows,ncols) with group numbers
+	# array of shape (nrows,ncols) with group numbers (starting from 0)
+	# note: all cells are labeled in a single pass, visiting each cell once;
+	#       groups are numbered in order of their first cell (row by row)
 	nrows = edges.shape[0]
 	ncols = edges.shape[1]
-	layout = np.zeros((nrows,ncols), dtype=int)
-	currentcell = (0,0)
-	currentgroup = 1
-	while True:
-		layout[currentcell] = currentgroup
-		added = [currentcell]
-		while len(added)>0:
-			toadd = []
-			for cell in added:
-				row = cell[0]
-				col = cell[1]
-				if( edges[row,col,0]==0 and layout[row-1,col]==0 ): toadd.append((row-1, col))
-				if( edges[row,col,1]==0 and layout[row,col+1]==0 ): toadd.append((row, col+1))
-				if( edges[row,col,2]==0 and layout[row+1,col]==0 ): toadd.append((row+1, col))
-				if( edges[row,col,3]==0 and layout[row,col-1]==0 ): toadd.append((row, col-1))
-			for cell in toadd:
-				row = cell[0]
-				col = cell[1]
-				layout[row,col] = currentgroup
-			added = toadd
-		currentgroup += 1
-		# find unfilled layout cells
-		temp = np.where(layout<0.5)
-		# if no unfilled layout cells, break the loop
-		if( len(temp[0])==0 ): break
-		# else start new iteration from first unfilled cell
-		currentcell = (temp[0][0], temp[1][0])
-		continue
-	# for use in Suguru class, need to start group numbers from 0
-	layout = layout - 1
+	layout = -np.ones((nrows,ncols), dtype=int)
+	openings = (edges==0).tolist()
+	directions = [(-1,0), (0,1), (1,0), (0,-1)]
+	currentgroup = 0
+	for startrow in range(nrows):
+		for startcol in range(ncols):
+			if layout[startrow,startcol]>=0: continue
+			layout[startrow,startcol] = currentgroup
+			toadd = deque([(startrow,startcol)])
+			while len(toadd)>0:
+				(row, col) = toadd.popleft()
+				for (direction, (drow, dcol)) in enumerate(directions):
+					if not openings[row][col][direction]: continue
+					nrow = row+drow
+					ncol = col+dcol
+					if( nrow<0 or nrow>=nrows or ncol<0 or ncol>=ncols ): continue
+					if layout[nrow,ncol]>=0: continue
+					layout[nrow,ncol] = currentgroup
+					toadd.append((nrow,ncol))
+			currentgroup += 1
 	return layout
 
 
+def twomeans(valuesbatch):
+	### exact two-class clustering of one-dimensional values
+	# for each array, the values are sorted and the split point minimizing
+	# the total within-class sum of squares is found using prefix sums.
+	# input arguments:
+	# - valuesbatch: list of 1D arrays (possibly of different lengths)
+	# returns:
+	# numpy array of shape (number of arrays, 2) with the lower and upper class means
+	# (if all values in an array are equal, both means are equal to this value)
+	nvalues = np.array([np.size(values) for values in valuesbatch], dtype=int)
+	if np.any(nvalues==0):
+		msg = 'ERROR in twomeans: found an empty array of values.'
+		raise Exception(msg)
+	nbatch = len(valuesbatch)
+	maxnvalues = np.amax(nvalues)
+	# put the sorted values in a zero-padded 2D array
+	values = np.zeros((nbatch,maxnvalues))
+	for i, thisvalues in enumerate(valuesbatch):
+		values[i,:nvalues[i]] = np.sort(np.ravel(thisvalues))
+	rows = np.arange(nbatch)
+	sums = np.cumsum(values, axis=1)
+	sqsums = np.cumsum(values**2, axis=1)
+	totalsums = sums[rows,nvalues-1]
+	totalsqsums = sqsums[rows,nvalues-1]
+	# sum of squares for each split point
+	# (the lower class holds the first nlow values)
+	nlow = np.arange(1,maxnvalues)
+	nhigh = nvalues[:,np.newaxis]-nlow
+	lowsums = sums[:,:-1]
+	highsums = totalsums[:,np.newaxis]-lowsums
+	with np.errstate(divide='ignore', invalid='ignore'):
+		sumsquares = (sqsums[:,:-1] - lowsums**2/nlow
+		              + totalsqsums[:,np.newaxis]-sqsums[:,:-1] - highsums**2/nhigh)
+		# only split between different values
+		valid = (nhigh>0) & (values[:,1:]>values[:,:-1])
+		sumsquares = np.where(valid, sumsquares, np.inf)
+	best = np.argmin(sumsquares, axis=1) if maxnvalues>1 else np.zeros(nbatch, dtype=int)
+	centers = np.zeros((nbatch,2))
+	centers[:,0] = sums[rows,best]/(best+1)
+	centers[:,1] = (totalsums-sums[rows,best])/np.maximum(nvalues-best-1,1)
+	# arrays without a valid split point
+	nosplit = ~np.any(valid, axis=1) if maxnvalues>1 else np.ones(nbatch, dtype=bool)
+	centers[nosplit,0] = values[nosplit,0]
+	centers[nosplit,1] = values[nosplit,0]
+	return centers
+
+
 def findthreshold(widths, doplot=False):
 	### find thickness threshold
 	# input arguments:
-	# - widths: a 1D array with values for widths
+	# - widths: a 1D array with values for widths,
+	#   or a list of such arrays to find a threshold for each of them
 	# returns:
 	# threshold value separating small from big widths
-	kmeans = KMeans(n_clusters=2).fit(widths.reshape(len(widths),1))
-	centers = sorted(kmeans.cluster_centers_.flatten())
+	# (or a list of threshold values if a list of arrays was provided)
+	if( isinstance(widths, (list,tuple)) and len(widths)>0 and np.ndim(widths[0])>0 ):
+		centers = twomeans(widths)
+		thresholds = [float(threshold) for threshold in np.mean(centers, axis=1)]
+		if doplot:
+			for thiswidths, thiscenters in zip(widths, centers):
+				plotthreshold(np.asarray(thiswidths), thiscenters)
+		return thresholds
+	centers = twomeans([widths])[0]
 	threshold = np.mean(centers)
-	if doplot:
-		maxwidth = int(np.max(widths))
-		bins = np.linspace(-0.5,maxwidth+0.5,num=maxwidth+2)
-		fig,ax = plt.subplots()
-		ax.hist(widths, bins=bins)
-		ymax = ax.get_ylim()[1]
-		for i, center in enumerate(centers):
-			ax.axvline(x=center, color='b', linestyle='--')
-			ax.text(center-0.5, ymax*0.9, 'Cluster {} ({:.2f})'.format(i+1,center),
-		      color='b', verticalalignment='top', horizontalalignment='right')
-		ax.axvline(x=threshold, color='r', linestyle='--')
-		ax.text(threshold-0.5, ymax*0.8, 'Threshold ({:.2f})'.format(threshold),
-		      color='r', verticalalignment='top', horizontalalignment='right')
-		ax.set_xlabel('Line thickness (pixels)', fontsize=13)
-		ax.set_ylabel('Number of lines', fontsize=13)
-		ax.set_title('Line thickness thresholding', fontsize=13)
+	if doplot: plotthreshold(widths, centers)
 	return threshold
 
+
+def newfigure(offscreen=False):
+	### make a new figure with a single axes object
+	# input arguments:
+	# - offscreen: if True, make a figure that is not managed by pyplot (see SuguruImageReader.drawimage)
+	# returns:
+	# tuple of (figure, axes)
+	if offscreen:
+		from matplotlib.figure import Figure
+		fig = Figure()
+		return (fig, fig.subplots())
+	import matplotlib.pyplot as plt
+	return plt.subplots()
+
+
+def plotthreshold(widths, centers, offscreen=False):
+	### make a plot of the width distribution and the threshold found by findthreshold
+	threshold = np.mean(centers)
+	maxwidth = int(np.max(widths))
+	bins = np.linspace(-0.5,maxwidth+0.5,num=maxwidth+2)
+	fig,ax = newfigure(offscreen=offscreen)
+	ax.hist(widths, bins=bins)
+	ymax = ax.get_ylim()[1]
+	for i, center in enumerate(centers):
+		ax.axvline(x=center, color='b', linestyle='--')
+		ax.text(center-0.5, ymax*0.9, 'Cluster {} ({:.2f})'.format(i+1,center),
+	      color='b', verticalalignment='top', horizontalalignment='right')
+	ax.axvline(x=threshold, color='r', linestyle='--')
+	ax.text(threshold-0.5, ymax*0.8, 'Threshold ({:.2f})'.format(threshold),
+	      color='r', verticalalignment='top', horizontalalignment='right')
+	ax.set_xlabel('Line thickness (pixels)', fontsize=13)
+	ax.set_ylabel('Number of lines', fontsize=13)
+	ax.set_title('Line thickness thresholding', fontsize=13)
+	return (fig,ax)
+
+	
 	
-		
 if __name__=='__main__':
 	# testing section
 	
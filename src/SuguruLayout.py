@@ -41,6 +41,14 @@ class SuguruLayout(object):
 		# set the instance attributes
 		self.layout = grid
 		self.ngroups = np.amax(grid)+1
+		# precompute group sizes, group cells and neighbours
+		# (these are needed in every solving step)
+		self.groupsizes = np.bincount(grid.flatten(), minlength=self.ngroups)
+		self.groupcells = [[] for groupid in range(self.ngroups)]
+		for cell in np.argwhere(grid>=0): self.groupcells[grid[cell[0],cell[1]]].append(cell)
+		self.groupcells = [np.array(cells).reshape(-1,2) for cells in self.groupcells]
+		(nrows,ncols) = grid.shape
+		self.neighbourcells = [[self.findneighbours(i,j) for j in range(ncols)] for i in range(nrows)]
 		
 	def initfromtxt(self, txtfile):
 		### initializer from a txt file name
@@ -61,36 +69,47 @@ class SuguruLayout(object):
 		# initialize this instance
 		self.initfromgrid(grid)
 		
-	def groupmask(self, groupid):
-		### get a mask array for a given group
+	def groupnumber(self, groupid):
+		### get the group number for a given group identifier
 		# input arguments:
 		# - groupid: group identifier; following cases are allowed:
 		#   - group number (integer)
 		#   - list, array or tuple of cell indices
-		if not isinstance(groupid, int):
+		if not isinstance(groupid, (int, np.integer)):
 			groupid = self.layout[groupid[0],groupid[1]] 
 		if(groupid >= self.ngroups):
-			msg = 'ERROR in SuguruLayout.getmask:'
+			msg = 'ERROR in SuguruLayout.groupnumber:'
 			msg += ' provided group number {}'.format(groupid)
 			msg += ' is larger than number of groups ({}).'.format(self.ngroups)
 			raise Exception(msg)
-		return self.layout == groupid
+		return int(groupid)
+		
+	def groupmask(self, groupid):
+		### get a mask array for a given group
+		# input arguments:
+		# - groupid: group identifier (see groupnumber)
+		return self.layout == self.groupnumber(groupid)
 	
 	def groupindices(self, groupid):
 		### get a collection of indices for a given group
-		return np.argwhere(self.groupmask(groupid))
+		# (note: the returned array should not be modified)
+		return self.groupcells[self.groupnumber(groupid)]
 	
 	def groupsize(self, groupid):
 		### get the size (number of cells) for a given group
-		return len(self.groupindices(groupid))
+		return int(self.groupsizes[self.groupnumber(groupid)])
 	
 	def maxgroupsize(self):
 		### get the maximum group size (in number of cells)
-		groupsizes = [self.groupsize(groupid) for groupid in range(self.ngroups)]
-		return max(groupsizes)
+		return int(np.amax(self.groupsizes))
 	
 	def neighbours(self, row, column):
 		### get a collection of indices of neighbouring cells
+		return list(self.neighbourcells[row][column])
+	
+	def findneighbours(self, row, column):
+		### find the indices of neighbouring cells
+		# (used for initialization, else use neighbours)
 		neighbours = []
 		(nrows,ncols) = self.layout.shape
 		for i in range(row-1,row+2):
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+# imports
+import multiprocessing as mp
+import numpy as np
+from SuguruLayout import SuguruLayout
+from Suguru import Suguru
+
+
+# state of worker processes
+# (set once per process by initworker)
+workerstate = {'layouts': {}, 'stopevent': None}
+
+
+def encodecandidates(suguru):
+	### encode the state of a Suguru instance as an array of candidate bitmasks
+	# bit k (for k >= 1) is set if k is a candidate for the cell,
+	# bit 0 is set if the cell is filled.
+	# returns:
+	# numpy array of type uint64 with the same shape as the grid
+	# (so the values must be smaller than 64)
+	nvalues = max(suguru.layout.maxgroupsize(), np.amax(suguru.grid))
+	if nvalues>=64:
+		msg = 'ERROR in encodecandidates:'
+		msg += ' values up to {} cannot be encoded (the maximum is 63).'.format(nvalues)
+		raise Exception(msg)
+	(nrows, ncols) = suguru.grid.shape
+	masks = np.zeros((nrows,ncols), dtype=np.uint64)
+	for i in range(nrows):
+		for j in range(ncols):
+			mask = 0
+			for value in suguru.candidates[i][j]: mask |= (1 << value)
+			if suguru.grid[i,j]!=0: mask = 1 | (1 << int(suguru.grid[i,j]))
+			masks[i,j] = mask
+	return masks
+
+
+def decodecandidates(layout, masks):
+	### make a Suguru instance from a SuguruLayout and an array of candidate bitmasks
+	# (see encodecandidates for the encoding)
+	(nrows, ncols) = masks.shape
+	grid = np.zeros((nrows,ncols), dtype=int)
+	candidates = []
+	for i in range(nrows):
+		candidates.append([])
+		for j in range(ncols):
+			mask = int(masks[i,j])
+			values = [value for value in range(1,mask.bit_length()) if mask & (1 << value)]
+			candidates[i].append(values)
+			if mask & 1: grid[i,j] = values[0]
+	suguru = Suguru()
+	suguru.initlayout(layout)
+	suguru.initfromgrid(grid)
+	suguru.candidates = candidates
+	suguru.inithash()
+	return suguru
+
+
+def splitsuguru(suguru, nsubproblems, maxdepth=6):
+	### split the search tree of a Suguru instance into subproblems
+	# branch breadth-first on the cell with the fewest candidates
+	# (applying the logical solving methods after each branch)
+	# until there are at least nsubproblems open subproblems.
+	# input arguments:
+	# - suguru: Suguru instance (not modified)
+	# - nsubproblems: minimum number of subproblems to create (if possible)
+	# - maxdepth: maximum branching depth
+	# returns:
+	# tuple of two lists, the first one with candidate bitmask arrays of open subproblems,
+	# the second one with candidate bitmask arrays of solutions found while splitting
+	root = decodecandidates(suguru.layout, encodecandidates(suguru))
+	root.propagate()
+	if not root.check_consistent(): return ([], [])
+	if root.check_complete(): return ([], [encodecandidates(root)])
+	subproblems = [encodecandidates(root)]
+	solutions = []
+	for depth in range(maxdepth):
+		if( len(subproblems)==0 or len(subproblems)>=nsubproblems ): break
+		newsubproblems = []
+		for masks in subproblems:
+			node = decodecandidates(suguru.layout, masks)
+			(row, column) = node.branchcell()
+			for value in node.candidates[row][column]:
+				child = decodecandidates(suguru.layout, masks)
+				child.assign(row, column, value)
+				child.propagate()
+				if not child.check_consistent(): continue
+				if child.check_complete(): solutions.append(encodecandidates(child))
+				else: newsubproblems.append(encodecandidates(child))
+		subproblems = newsubproblems
+	return (subproblems, solutions)
+
+
+def initworker(layouts, stopevent):
+	### initialize a worker process
+	# input arguments:
+	# - layouts: dict matching layout ids to layout arrays
+	# - stopevent: multiprocessing Event signaling that all workers can stop
+	for layoutid, layout in layouts.items():
+		slayout = SuguruLayout()
+		slayout.initfromgrid(layout)
+		workerstate['layouts'][layoutid] = slayout
+	workerstate['stopevent'] = stopevent
+
+
+def searchsubproblem(task):
+	### search a single subproblem in a worker process
+	# input arguments:
+	# - task: tuple of (layout id, candidate bitmask array, count)
+	# returns:
+	# tuple of (number of solutions, candidate bitmask array of first solution or None)
+	(layoutid, masks, count) = task
+	stopevent = workerstate['stopevent']
+	if stopevent.is_set(): return (0, None)
+	suguru = decodecandidates(workerstate['layouts'][layoutid], masks)
+	nsolutions = suguru.search(count=count, stop=stopevent.is_set)
+	if nsolutions==0: return (0, None)
+	return (nsolutions, encodecandidates(suguru))
+
+
+def parallelsearch(suguru, nprocesses=None, count=False, nsubproblems=None, maxdepth=6):
+	### parallel version of Suguru.search
+	# the search tree is split at shallow depth into subproblems,
+	# which are distributed over a pool of worker processes.
+	# the subproblems are handed out one by one, so idle workers take over remaining work;
+	# all workers stop as soon as one of them finds a solution (unless count is True).
+	# input arguments:
+	# - suguru: Suguru instance
+	# - nprocesses: number of worker processes (default: number of cpus)
+	# - count: if False, stop after the first solution, else count all solutions
+	# - nsubproblems: number of subproblems to aim for (default: 8 per worker process)
+	# - maxdepth: maximum branching depth for splitting the search tree
+	# returns:
+	# the number of solutions found;
+	# the grid and candidates of suguru are set to the first solution (or left unchanged if none)
+	if nprocesses is None: nprocesses = mp.cpu_count()
+	if nsubproblems is None: nsubproblems = 8*nprocesses
+	(subproblems, solutions) = splitsuguru(suguru, nsubproblems, maxdepth=maxdepth)
+	nsolutions = len(solutions)
+	if( len(subproblems)>0 and (count or nsolutions==0) ):
+		layoutid = 0
+		layouts = {layoutid: suguru.layout.layout}
+		stopevent = mp.Event()
+		tasks = [(layoutid, masks, count) for masks in subproblems]
+		pool = mp.Pool(processes=nprocesses, initializer=initworker, initargs=(layouts, stopevent))
+		try:
+			for (nsubsolutions, masks) in pool.imap_unordered(searchsubproblem, tasks, chunksize=1):
+				nsolutions += nsubsolutions
+				if masks is not None: solutions.append(masks)
+				if( nsolutions>0 and not count ):
+					stopevent.set()
+					break
+		finally:
+			pool.terminate()
+			pool.join()
+	if len(solutions)==0: return nsolutions
+	solution = decodecandidates(suguru.layout, solutions[0])
+	suguru.setstate(solution.copystate())
+	return nsolutions
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+
+# Portfolio solving: several solving strategies are started at once, each in its own process,
+# the first definitive answer (solved, or proven to have no solution) is taken and the other strategies are stopped.
+# The winning strategy of each suguru can be logged, to see which strategy is best as default.
+#
+# Usage: python3 src/SuguruPortfolio.py <suguru txt file(s)> [--strategies s1 s2 ...] [--log <log file>]
+
+# imports
+import os
+import json
+import time
+import queue
+import argparse
+import multiprocessing as mp
+import numpy as np
+from Suguru import Suguru
+from SuguruSession import SuguruSession
+
+
+# registry of the solving strategies (maps the strategy name to its function, see registerstrategy)
+strategyregistry = {}
+
+
+def registerstrategy(name, function):
+	### add a solving strategy to the registry (or replace an existing one with the same name)
+	# input arguments:
+	# - name: name of the strategy
+	# - function: function taking a layout and a grid (2D numpy arrays),
+	#   and returning a tuple of (result code, result message, grid), see Suguru.solve
+	#   (it runs in a separate process, so it must be defined at module level)
+	strategyregistry[name] = function
+
+
+def solvelogic(layout, grid):
+	### strategy: basic and intermediate solving methods only
+	suguru = Suguru()
+	suguru.initfromgrids(layout, grid)
+	(resultcode, resultmessage) = suguru.solve(probe=False)
+	return (resultcode, resultmessage, suguru.grid)
+
+
+def solveprobe(layout, grid):
+	### strategy: solving methods with probing, without search
+	suguru = Suguru()
+	suguru.initfromgrids(layout, grid)
+	(resultcode, resultmessage) = suguru.solve()
+	return (resultcode, resultmessage, suguru.grid)
+
+
+def solvesearch(layout, grid):
+	### strategy: solving methods with probing, followed by search (the default of the GUI and the service)
+	suguru = Suguru()
+	suguru.initfromgrids(layout, grid)
+	(resultcode, resultmessage) = suguru.solve(search=True)
+	return (resultcode, resultmessage, suguru.grid)
+
+
+def solvesearchnoprobe(layout, grid):
+	### strategy: search right after the basic and intermediate solving methods
+	suguru = Suguru()
+	suguru.initfromgrids(layout, grid)
+	(resultcode, resultmessage) = suguru.solve(probe=False, search=True)
+	return (resultcode, resultmessage, suguru.grid)
+
+
+def solverandomsearch(layout, grid):
+	### strategy: search with the values of each branch in random order
+	suguru = Suguru()
+	suguru.initfromgrids(layout, grid)
+	suguru.propagate()
+	if not suguru.check_consistent(): return (-1, 'Suguru invalid', suguru.grid)
+	for solution in suguru.iter_solutions(limit=1, order='random', seed=os.getpid()):
+		return (0, 'Suguru solved', solution)
+	return (-1, 'Suguru invalid', suguru.grid)
+
+
+def solvesessionsearch(layout, grid):
+	### strategy: search in a SuguruSession (backtracking only undoes the deductions of a branch)
+	session = SuguruSession()
+	session.initfromgrids(layout, grid)
+	if not session.check_consistent(): return (-1, 'Suguru invalid', session.grid)
+	for solution in session.iter_solutions(limit=1):
+		return (0, 'Suguru solved', solution)
+	return (-1, 'Suguru invalid', session.grid)
+
+
+registerstrategy('logic', solvelogic)
+registerstrategy('probe', solveprobe)
+registerstrategy('search', solvesearch)
+registerstrategy('searchnoprobe', solvesearchnoprobe)
+registerstrategy('randomsearch', solverandomsearch)
+registerstrategy('sessionsearch', solvesessionsearch)
+
+
+def runstrategy(name, function, layout, grid, results):
+	### run a strategy (in a separate process) and put its result in the results queue
+	starttime = time.time()
+	try:
+		(resultcode, resultmessage, solution) = function(layout, grid)
+		result = (name, int(resultcode), resultmessage, np.array(solution, dtype=int), time.time()-starttime)
+	except Exception as e:
+		result = (name, None, str(e), None, time.time()-starttime)
+	results.put(result)
+
+
+def portfoliosolve(layout, grid, strategies=None, timeout=None, logfile=None):
+	### solve a suguru by running several strategies at once, each in its own process
+	# the first definitive result (result code 0 or -1, see Suguru.solve) is taken,
+	# and the processes of the other strategies are stopped.
+	# input arguments:
+	# - layout and grid: 2D numpy arrays
+	# - strategies: list of strategy names (default: all registered strategies)
+	# - timeout: maximum time in seconds to wait for a definitive result (default: no limit)
+	# - logfile: file to which a line is appended (in json format) with the winning strategy,
+	#   the time, the grid size and the strategies that finished without a definitive result
+	# returns:
+	# tuple of (result code, result message, grid, name of the winning strategy);
+	# if no strategy gives a definitive result, the result with the most filled cells is returned
+	# (with result code 2 if the timeout was reached, or -1 if all strategies failed with an error),
+	# and the winning strategy is None
+	if strategies is None: strategies = list(strategyregistry)
+	for name in strategies:
+		if name not in strategyregistry:
+			msg = 'ERROR in portfoliosolve:'
+			msg += ' strategy {} not recognized.'.format(name)
+			raise Exception(msg)
+	layout = np.asarray(layout, dtype=int)
+	grid = np.asarray(grid, dtype=int)
+	starttime = time.time()
+	results = mp.Queue()
+	processes = {}
+	for name in strategies:
+		process = mp.Process(target=runstrategy, args=(name, strategyregistry[name], layout, grid, results),
+		                     daemon=True)
+		process.start()
+		processes[name] = process
+	winner = None
+	best = (1, 'Suguru incomplete', np.copy(grid))
+	error = None
+	finished = {}
+	try:
+		while len(finished)<len(processes):
+			remaining = None if timeout is None else timeout-(time.time()-starttime)
+			if( remaining is not None and remaining<=0 ): break
+			try:
+				(name, resultcode, resultmessage, solution, runtime) = results.get(
+				  timeout=(0.1 if remaining is None else min(remaining, 0.1)))
+			except queue.Empty:
+				# (a process that ended without a result counts as finished)
+				for (name, process) in processes.items():
+					if( name not in finished and not process.is_alive() and process.exitcode!=0 ):
+						finished[name] = {'resultcode': None, 'time': time.time()-starttime}
+				continue
+			finished[name] = {'resultcode': resultcode, 'time': runtime}
+			if resultcode is None: error = resultmessage
+			if resultcode in [0, -1]:
+				winner = name
+				best = (resultcode, resultmessage, solution)
+				break
+			if( solution is not None and np.count_nonzero(solution)>np.count_nonzero(best[2]) ):
+				best = (resultcode, resultmessage, solution)
+	finally:
+		for process in processes.values():
+			if process.is_alive(): process.terminate()
+		for process in processes.values(): process.join()
+		results.close()
+	if( winner is None and len(finished)<len(processes) ): best = (2, 'Suguru limit reached', best[2])
+	elif( winner is None and all(info['resultcode'] is None for info in finished.values()) ):
+		best = (-1, 'Suguru invalid ({})'.format(error), best[2])
+	if logfile is not None:
+		record = {'winner': winner, 'resultcode': best[0], 'time': time.time()-starttime,
+		          'shape': list(grid.shape), 'strategies': strategies,
+		          'finished': {name: info for (name, info) in finished.items() if name!=winner}}
+		with open(logfile, 'a') as f: f.write(json.dumps(record)+'\n')
+	return (best[0], best[1], best[2], winner)
+
+
+def summarizelog(logfile):
+	### count the wins of each strategy in a log file written by portfoliosolve
+	# returns:
+	# dict matching strategy names (None if no strategy won) to tuples of (number of wins, average time)
+	wins = {}
+	with open(logfile, 'r') as f:
+		for line in f:
+			if line.strip()=='': continue
+			record = json.loads(line)
+			(nwins, totaltime) = wins.get(record['winner'], (0, 0.))
+			wins[record['winner']] = (nwins+1, totaltime+record['time'])
+	return {name: (nwins, totaltime/nwins) for (name, (nwins, totaltime)) in wins.items()}
+
+
+if __name__=='__main__':
+
+	parser = argparse.ArgumentParser(description='Solve sugurus with a portfolio of strategies in parallel')
+	parser.add_argument('files', nargs='+', help='Suguru txt files (see the examples)')
+	parser.add_argument('-s', '--strategies', nargs='+', default=None, choices=list(strategyregistry))
+	parser.add_argument('-t', '--timeout', type=float, default=None)
+	parser.add_argument('-l', '--log', default=None, help='Log file for the winning strategies')
+	args = parser.parse_args()
+
+	for txtfile in args.files:
+		suguru = Suguru()
+		suguru.initfromtxt(txtfile)
+		starttime = time.time()
+		(resultcode, resultmessage, solution, winner) = portfoliosolve(
+		  suguru.layout.layout, suguru.grid, strategies=args.strategies, timeout=args.timeout, logfile=args.log)
+		print('{}: {} (strategy {}, {:.3f} s)'.format(txtfile, resultmessage, winner, time.time()-starttime))
+		print(solution)
+	if args.log is not None:
+		for (name, (nwins, averagetime)) in summarizelog(args.log).items():
+			print('strategy {}: {} wins, average time {:.3f} s'.format(name, nwins, averagetime))
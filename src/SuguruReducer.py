@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+
+# imports
+import random
+import numpy as np
+from Suguru import Suguru
+from SuguruSession import SuguruSession
+
+
+def removalgroups(shape, order='random', seed=None):
+	### get the order in which to try removing givens
+	# input arguments:
+	# - shape: shape of the grid
+	# - order: either 'random' (cells one by one in random order)
+	#   or 'symmetric' (pairs of cells that are each other's image under a rotation by 180 degrees,
+	#   in random order; the resulting givens are symmetric)
+	# - seed: random seed
+	# returns:
+	# list of lists of cells (tuples of (row index, column index)) to remove together
+	if order not in ['random', 'symmetric']:
+		msg = 'ERROR in removalgroups:'
+		msg += ' order {} not recognized.'.format(order)
+		raise Exception(msg)
+	(nrows, ncols) = shape
+	groups = []
+	for i in range(nrows):
+		for j in range(ncols):
+			if order=='random': groups.append([(i,j)])
+			else:
+				image = (nrows-1-i, ncols-1-j)
+				if (i,j)<image: groups.append([(i,j), image])
+				elif (i,j)==image: groups.append([(i,j)])
+	random.Random(seed).shuffle(groups)
+	return groups
+
+
+def isunique(session, cells, solution):
+	### check that a puzzle still has a unique solution after removing the givens in some cells
+	# input arguments:
+	# - session: SuguruSession holding the puzzle after the removal (already propagated)
+	# - cells: list of cells whose givens were removed
+	# - solution: 2D numpy array with the (unique) solution before the removal
+	# returns:
+	# True if the solution is still unique, False otherwise
+	# (the puzzle had a unique solution before the removal,
+	#  so another solution must differ from it in one of the removed cells)
+	cells = [cell for cell in cells if session.grid[cell]==0]
+	for (k, (row, column)) in enumerate(cells):
+		# look for a solution that differs from the original solution in this cell
+		# (and equals it in the previous cells, which were covered in a previous step);
+		# this is done with temporary removals in the session itself, so the search starts
+		# from its current deductions and only the deductions of the search are undone afterwards
+		facts = []
+		for (i, j) in cells[:k]:
+			facts += session.exclude(i, j, [value for value in session.candidates[i][j] if value!=solution[i,j]])
+		facts += session.exclude(row, column, [solution[row,column]])
+		solutions = session.iter_solutions(limit=1)
+		found = next(solutions, None) is not None
+		solutions.close()
+		session.release(facts)
+		if found: return False
+	return True
+
+
+def reducegivens(suguru, order='random', target='unique', seed=None, verbose=False):
+	### reduce the givens of a solved suguru to a minimal set
+	# starting from the full solution, the givens are removed one by one (or pair by pair),
+	# and a removal is undone if the puzzle no longer meets the target.
+	# the solver state is kept between removals in a SuguruSession, so a removal only
+	# undoes the deductions that depended on the removed givens;
+	# if the solving methods still deduce the removed values, the solution is unique without search,
+	# else the search for another solution also runs in the session (see isunique).
+	# the result is minimal: removing any further given (or pair of givens) breaks the target.
+	# input arguments:
+	# - suguru: Suguru instance with a completely solved grid (not modified)
+	# - order: order of removal, see removalgroups
+	# - target: condition the reduced puzzle must meet, with the following options:
+	#   - 'unique': the puzzle has a unique solution
+	#   - 'probe': the puzzle can be solved without search (see Suguru.solve)
+	#   - 'logic': the puzzle can be solved with the basic and intermediate solving methods only
+	#     (see Suguru.propagate)
+	# - seed: random seed for the order of removal
+	# returns:
+	# 2D numpy array with the reduced givens (0 for unknown cells)
+	if target not in ['unique', 'probe', 'logic']:
+		msg = 'ERROR in reducegivens:'
+		msg += ' target {} not recognized.'.format(target)
+		raise Exception(msg)
+	if( suguru.grid is None or not suguru.check_complete() or not suguru.check_valid() ):
+		msg = 'ERROR in reducegivens:'
+		msg += ' expected a completely and validly solved suguru.'
+		raise Exception(msg)
+	solution = np.copy(suguru.grid)
+	session = SuguruSession()
+	session.initlayout(suguru.layout)
+	session.initfromgrid(np.copy(solution))
+	nremoved = 0
+	nsearched = 0
+	for cells in removalgroups(solution.shape, order=order, seed=seed):
+		for (row, column) in cells: session.setgiven(row, column, 0, propagate=False)
+		session.propagate()
+		if target=='logic': keep = session.check_complete()
+		elif target=='probe':
+			copy = session.tosuguru()
+			keep = (copy.solve(search=False)[0]==0)
+		else:
+			keep = all(session.grid[cell]!=0 for cell in cells)
+			if not keep:
+				nsearched += 1
+				keep = isunique(session, cells, solution)
+		if keep:
+			nremoved += len(cells)
+			continue
+		for (row, column) in cells: session.setgiven(row, column, solution[row,column], propagate=False)
+		session.propagate()
+	if verbose:
+		msg = 'Removed {} of {} givens'.format(nremoved, solution.size)
+		msg += ' ({} removals needed a search).'.format(nsearched)
+		print(msg)
+	return np.copy(session.givens)
+
+
+if __name__=='__main__':
+	# testing section
+
+	import time
+	suguru = Suguru()
+	suguru.initfromtxt('../examples/example2.txt')
+	suguru.solve(search=True)
+	for order in ['random', 'symmetric']:
+		for target in ['unique', 'probe', 'logic']:
+			starttime = time.time()
+			givens = reducegivens(suguru, order=order, target=target, seed=1, verbose=True)
+			print('order {}, target {}: {} givens ({:.2f} s)'.format(
+			      order, target, np.count_nonzero(givens), time.time()-starttime))
+			print(givens)
+			# check that the reduced puzzle has a unique solution
+			check = Suguru()
+			check.initfromgrids(np.copy(suguru.layout.layout), givens)
+			print('number of solutions: {}'.format(check.search(count=True)))
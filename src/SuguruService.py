@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+
+# Local HTTP/JSON service for solving sugurus (standard library only).
+# Requests are solved in a pool of worker processes that is started (and warmed up) once,
+# so that a request does not pay the startup cost of a new python process.
+# Requests for grids of the same size that arrive close together are sent to a worker as one batch.
+#
+# Endpoints:
+# - POST /solve with a json body {"layout": [[...]], "grid": [[...]]}
+#   and optionally "search" (bool, see Suguru.solve) and "timeout" (in seconds);
+#   the response holds "resultcode", "resultmessage" and "solution" (see Suguru.solve),
+#   or "error" (with status 400 for invalid input and 504 for a timeout).
+#   the solving itself stops shortly before the timeout, with result code 2 and the partial solution
+#   (then the response also holds "candidates", the remaining candidates of each cell).
+# - GET /health: status of the service.
+#
+# Usage: python3 src/SuguruService.py [--host 127.0.0.1] [--port 8080] [--nprocesses N]
+
+# imports
+import os
+import json
+import time
+import asyncio
+import argparse
+import http.client
+import concurrent.futures
+import numpy as np
+from Suguru import Suguru
+
+
+# reason phrases for the http status codes used by the service
+statusreasons = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+                 413: 'Payload Too Large', 500: 'Internal Server Error', 504: 'Gateway Timeout'}
+
+
+def solvebatch(tasks):
+	### solve a batch of sugurus (in a worker process)
+	# input arguments:
+	# - tasks: list of tuples of (layout, grid, search, deadline),
+	#   with layout and grid nested lists, search a bool (see Suguru.solve),
+	#   and deadline the time (as given by time.time) at which to stop solving, or None
+	# returns:
+	# list of dicts with the result for each task
+	# (either with keys 'resultcode', 'resultmessage' and 'solution', or with key 'error')
+	results = []
+	for (layout, grid, search, deadline) in tasks:
+		try:
+			suguru = Suguru()
+			suguru.initfromgrids(np.array(layout, dtype=int), np.array(grid, dtype=int))
+			timelimit = None if deadline is None else max(0., deadline-time.time())
+			(resultcode, resultmessage) = suguru.solve(search=search, timelimit=timelimit)
+			result = {'resultcode': resultcode, 'resultmessage': resultmessage,
+			          'solution': suguru.grid.tolist()}
+			if resultcode==2: result['candidates'] = [[list(map(int, candidates)) for candidates in row]
+			                                          for row in suguru.candidates]
+			results.append(result)
+		except Exception as e:
+			results.append({'error': str(e)})
+	return results
+
+
+def warmup():
+	### warm up a worker process by solving a small suguru
+	# (this makes sure all modules are imported and the process is running before the first request)
+	solvebatch([([[0,0],[1,1]], [[0,0],[0,0]], True, None)])
+	return True
+
+
+class SuguruService(object):
+	### asyncio HTTP/JSON service for solving sugurus
+
+	def __init__(self, host='127.0.0.1', port=8080, nprocesses=None,
+	             maxconcurrent=64, timeout=10., solvefraction=0.9, batchsize=16, batchwait=0.002,
+	             maxbodysize=1<<20):
+		### initializer
+		# input arguments:
+		# - host and port: address to listen on (port 0 picks a free port, see self.port after start)
+		# - nprocesses: number of worker processes (default: number of cpus)
+		# - maxconcurrent: maximum number of requests being solved at the same time
+		#   (further requests wait until a slot is free, within their timeout)
+		# - timeout: default timeout per request in seconds
+		#   (the solving stops after a fraction solvefraction of the timeout,
+		#    so a partial solution can be returned in time;
+		#    note: a request that still times out, e.g. while waiting for a free worker, is answered immediately,
+		#    but a batch that is already being solved runs to completion in its worker)
+		# - solvefraction: fraction of the timeout after which to stop solving
+		# - batchsize: maximum number of requests in a batch
+		# - batchwait: time (in seconds) to wait for more requests of the same grid size before solving a batch
+		# - maxbodysize: maximum size of a request body in bytes
+		self.host = host
+		self.port = port
+		self.nprocesses = nprocesses
+		self.maxconcurrent = maxconcurrent
+		self.timeout = timeout
+		self.solvefraction = solvefraction
+		self.batchsize = batchsize
+		self.batchwait = batchwait
+		self.maxbodysize = maxbodysize
+		self.pool = None
+		self.server = None
+		self.semaphore = None
+		# pending batches and their timers, per grid size
+		self.batches = {}
+		self.timers = {}
+		# counters (for the health endpoint)
+		self.nrequests = 0
+		self.nbatches = 0
+		self.ntimeouts = 0
+
+	async def start(self):
+		### start the worker processes and the server
+		loop = asyncio.get_running_loop()
+		if self.nprocesses is None: self.nprocesses = os.cpu_count()
+		self.pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.nprocesses)
+		# submit one warm-up task per worker process, so that all of them are started
+		await asyncio.gather(*[loop.run_in_executor(self.pool, warmup) for i in range(self.nprocesses)])
+		self.semaphore = asyncio.Semaphore(self.maxconcurrent)
+		self.server = await asyncio.start_server(self.handleconnection, self.host, self.port)
+		self.port = self.server.sockets[0].getsockname()[1]
+
+	async def stop(self):
+		### stop the server and the worker processes
+		if self.server is not None:
+			self.server.close()
+			await self.server.wait_closed()
+			self.server = None
+		for timer in self.timers.values(): timer.cancel()
+		self.timers = {}
+		if self.pool is not None:
+			self.pool.shutdown(wait=True, cancel_futures=True)
+			self.pool = None
+
+	async def serve(self):
+		### start the service and serve until cancelled
+		await self.start()
+		print('Serving on http://{}:{} with {} worker processes'.format(self.host, self.port, self.nprocesses))
+		try:
+			await self.server.serve_forever()
+		finally:
+			await self.stop()
+
+	async def solve(self, layout, grid, search=False, deadline=None):
+		### solve a suguru in the worker pool
+		# input arguments:
+		# - layout and grid: nested lists of integers with the same shape
+		# - search: see Suguru.solve
+		# - deadline: time (as given by time.time) at which to stop solving (default: no limit)
+		# returns:
+		# dict with the result (see solvebatch)
+		async with self.semaphore:
+			future = asyncio.get_running_loop().create_future()
+			key = (len(grid), len(grid[0]) if len(grid)>0 else 0)
+			self.enqueue(key, ((layout, grid, search, deadline), future))
+			return await future
+
+	def enqueue(self, key, item):
+		### add a task to the pending batch for its grid size
+		batch = self.batches.setdefault(key, [])
+		batch.append(item)
+		if len(batch)>=self.batchsize: self.flush(key)
+		elif len(batch)==1:
+			self.timers[key] = asyncio.get_running_loop().call_later(self.batchwait, self.flush, key)
+
+	def flush(self, key):
+		### send the pending batch for a grid size to the worker pool
+		timer = self.timers.pop(key, None)
+		if timer is not None: timer.cancel()
+		# (skip tasks whose request has already timed out)
+		batch = [(task, future) for (task, future) in self.batches.pop(key, []) if not future.done()]
+		if len(batch)==0: return
+		self.nbatches += 1
+		loop = asyncio.get_running_loop()
+		poolfuture = loop.run_in_executor(self.pool, solvebatch, [task for (task, _) in batch])
+		poolfuture.add_done_callback(lambda poolfuture: self.dispatch(batch, poolfuture))
+
+	def dispatch(self, batch, poolfuture):
+		### pass the results of a solved batch to the waiting requests
+		if poolfuture.cancelled(): error = Exception('solving was cancelled')
+		else: error = poolfuture.exception()
+		results = poolfuture.result() if error is None else [None]*len(batch)
+		for (_, future), result in zip(batch, results):
+			if future.done(): continue
+			if error is not None: future.set_exception(error)
+			else: future.set_result(result)
+
+	async def handlerequest(self, method, path, body):
+		### handle a single http request
+		# returns:
+		# tuple of (http status code, dict to send as json)
+		if path=='/health':
+			if method!='GET': return (405, {'error': 'use GET for /health'})
+			return (200, {'status': 'ok', 'nprocesses': self.nprocesses, 'nrequests': self.nrequests,
+			              'nbatches': self.nbatches, 'ntimeouts': self.ntimeouts})
+		if path!='/solve': return (404, {'error': 'unknown path {}'.format(path)})
+		if method!='POST': return (405, {'error': 'use POST for /solve'})
+		self.nrequests += 1
+		# parse and check the request
+		try:
+			payload = json.loads(body.decode('utf-8'))
+			layout = payload['layout']
+			grid = payload['grid']
+			search = bool(payload.get('search', False))
+			timeout = float(payload.get('timeout', self.timeout))
+			if np.array(layout).shape!=np.array(grid).shape or np.ndim(grid)!=2:
+				raise Exception('layout and grid must be 2D lists of the same shape')
+		except Exception as e:
+			return (400, {'error': 'invalid request: {}'.format(e)})
+		# solve
+		try:
+			deadline = time.time()+self.solvefraction*timeout
+			result = await asyncio.wait_for(self.solve(layout, grid, search=search, deadline=deadline), timeout)
+		except asyncio.TimeoutError:
+			self.ntimeouts += 1
+			return (504, {'error': 'timeout after {} seconds'.format(timeout)})
+		except Exception as e:
+			return (500, {'error': str(e)})
+		if 'error' in result: return (400, result)
+		return (200, result)
+
+	async def handleconnection(self, reader, writer):
+		### handle a client connection (possibly with multiple requests, using keep-alive)
+		try:
+			while True:
+				requestline = await reader.readline()
+				if not requestline: break
+				parts = requestline.decode('latin-1').split()
+				headers = {}
+				while True:
+					line = await reader.readline()
+					if line in [b'\r\n', b'\n', b'']: break
+					(name, _, value) = line.decode('latin-1').partition(':')
+					headers[name.strip().lower()] = value.strip()
+				if len(parts)!=3:
+					self.writeresponse(writer, 400, {'error': 'malformed request line'}, False)
+					break
+				(method, path, version) = parts
+				length = int(headers.get('content-length', 0))
+				if length>self.maxbodysize:
+					self.writeresponse(writer, 413, {'error': 'request body too large'}, False)
+					break
+				body = await reader.readexactly(length) if length>0 else b''
+				(status, response) = await self.handlerequest(method, path.split('?')[0], body)
+				keepalive = ( version=='HTTP/1.1' and headers.get('connection', '').lower()!='close' )
+				self.writeresponse(writer, status, response, keepalive)
+				await writer.drain()
+				if not keepalive: break
+		except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+			pass
+		finally:
+			writer.close()
+
+	def writeresponse(self, writer, status, response, keepalive):
+		### write a json response
+		body = json.dumps(response).encode('utf-8')
+		head = 'HTTP/1.1 {} {}\r\n'.format(status, statusreasons.get(status, ''))
+		head += 'Content-Type: application/json\r\n'
+		head += 'Content-Length: {}\r\n'.format(len(body))
+		head += 'Connection: {}\r\n\r\n'.format('keep-alive' if keepalive else 'close')
+		writer.write(head.encode('latin-1')+body)
+
+
+def solveremote(layout, grid, host='127.0.0.1', port=8080, search=False, timeout=None):
+	### client function: solve a suguru using a running SuguruService
+	# input arguments:
+	# - layout and grid: 2D numpy arrays or nested lists
+	# - host and port: address of the service
+	# - search: see Suguru.solve
+	# - timeout: timeout in seconds (default: the default timeout of the service)
+	# returns:
+	# tuple of (http status code, dict with the response)
+	payload = {'layout': np.asarray(layout).tolist(), 'grid': np.asarray(grid).tolist(), 'search': search}
+	if timeout is not None: payload['timeout'] = timeout
+	connection = http.client.HTTPConnection(host, port)
+	try:
+		connection.request('POST', '/solve', body=json.dumps(payload),
+		                   headers={'Content-Type': 'application/json'})
+		response = connection.getresponse()
+		return (response.status, json.loads(response.read().decode('utf-8')))
+	finally:
+		connection.close()
+
+
+if __name__=='__main__':
+
+	parser = argparse.ArgumentParser(description='Serve a local HTTP/JSON suguru solving service')
+	parser.add_argument('--host', default='127.0.0.1')
+	parser.add_argument('--port', type=int, default=8080)
+	parser.add_argument('-n', '--nprocesses', type=int, default=None)
+	parser.add_argument('--maxconcurrent', type=int, default=64)
+	parser.add_argument('--timeout', type=float, default=10.,
+	                    help='Default timeout per request in seconds')
+	parser.add_argument('--batchsize', type=int, default=16)
+	args = parser.parse_args()
+
+	service = SuguruService(host=args.host, port=args.port, nprocesses=args.nprocesses,
+	                        maxconcurrent=args.maxconcurrent, timeout=args.timeout, batchsize=args.batchsize)
+	try: asyncio.run(service.serve())
+	except KeyboardInterrupt: pass
@@ -0,0 +1,466 @@
+# -*- coding: utf-8 -*-
+
+# imports
+import time
+import random
+import numpy as np
+from Suguru import Suguru, SuguruLimitReached
+
+
+class SuguruSession(Suguru):
+	### solver session for editing a suguru interactively
+	# the session keeps the state of the solver between edits:
+	# the known values entered by the user (the givens) and the candidates removed by hand
+	# are the premises, and every candidate removed by the solving methods is recorded together
+	# with the removals it was deduced from (see Suguru.removecandidate for the reasons).
+	# when the user changes a given or a candidate, only the deductions that depended on it
+	# are undone, and the solving methods are applied again to the affected cells and groups only.
+	# the session also has its own search (see iter_solutions), which branches by adding
+	# and removing premises, so backtracking only undoes the deductions of the branch.
+	# note: only the solving methods used in propagate are tracked;
+	#       for probing or for other techniques from the registry (see Suguru.registertechnique),
+	#       first make a plain copy with tosuguru.
+
+	def __init__(self):
+		### empty initializer
+		super(SuguruSession, self).__init__()
+		self.givens = None
+		# candidates removed by hand, as set of (row, column, value)
+		self.userremovals = set()
+		# for each removed candidate (row, column, value): the reason for removing it,
+		# either 'given', 'user' or 'branch' for premises (see setgiven, setcandidate and exclude),
+		# or a tuple of the removals it was deduced from
+		self.reasons = {}
+		# for each removed candidate: the set of removals that were deduced from it
+		self.dependents = {}
+		# cells and groups for which the solving methods need to be applied again
+		self.dirtycells = set()
+		self.dirtygroups = set()
+		# cells that changed since the last call to popchanges
+		self.changedcells = set()
+		# removals that fill in the solution found by search (undone at the next edit, see search)
+		self.solutionfacts = []
+
+	def initfromgrid(self, grid):
+		### set the givens from a provided grid and apply the solving methods
+		# (see Suguru.initfromgrid)
+		Suguru.initfromgrid(self, grid)
+		grid = self.grid
+		Suguru.initfromgrid(self, np.zeros(grid.shape, dtype=int))
+		self.givens = np.zeros(grid.shape, dtype=int)
+		self.userremovals = set()
+		self.reasons = {}
+		self.dependents = {}
+		self.dirtycells = set()
+		self.dirtygroups = set()
+		self.changedcells = set()
+		self.solutionfacts = []
+		for (i, j) in np.argwhere(grid):
+			self.setgiven(i, j, grid[i,j], propagate=False)
+		# (the solving methods can also make progress in cells and groups without givens)
+		for (i, j) in np.ndindex(grid.shape): self.markdirty(i, j)
+		self.propagate()
+
+	def initfromgrids(self, layout, grid, candidates=None):
+		### combination of initlayout and initfromgrid with two provided grids
+		# input arguments:
+		# - candidates: optional 3D list with the allowed candidates for each cell
+		#   (candidates not in it are removed by hand, see setcandidate)
+		Suguru.initfromgrids(self, layout, grid)
+		if candidates is None: return
+		(nrows, ncols) = self.grid.shape
+		for i in range(nrows):
+			for j in range(ncols):
+				for value in range(1, self.layout.groupsize((i,j))+1):
+					if value not in candidates[i][j]: self.setcandidate(i, j, value, False, propagate=False)
+		self.propagate()
+
+	def tosuguru(self):
+		### get a plain Suguru with a copy of the current state
+		suguru = Suguru()
+		suguru.initlayout(self.layout)
+		suguru.nogoods = self.nogoods
+		suguru.zobristkeys = self.zobristkeys
+		suguru.setstate(self.copystate())
+		suguru.techniques = self.techniques
+		return suguru
+
+	def setstate(self, state):
+		### not supported for a session
+		# (the recorded reasons would no longer match the candidates)
+		msg = 'ERROR in SuguruSession.setstate:'
+		msg += ' the state of a session cannot be set directly;'
+		msg += ' use tosuguru to get a plain Suguru.'
+		raise Exception(msg)
+
+	def popchanges(self):
+		### get the cells whose value or candidates changed since the last call
+		# returns:
+		# set of (row index, column index)
+		changedcells = self.changedcells
+		self.changedcells = set()
+		return changedcells
+
+	def status(self):
+		### get the status of the current state
+		# returns:
+		# tuple of (int, info string) with the same convention as Suguru.solve
+		if not self.check_consistent(): return (-1, 'Suguru invalid')
+		if not self.check_complete(): return (1, 'Suguru incomplete')
+		return (0, 'Suguru solved')
+
+	def setgiven(self, row, column, value, propagate=True):
+		### set (or clear, with value 0) a known value in a cell
+		# input arguments:
+		# - propagate: whether to apply the solving methods afterwards
+		row = int(row)
+		column = int(column)
+		value = int(value)
+		oldvalue = self.givens[row,column]
+		if oldvalue==value: return
+		self.clearsolution()
+		if oldvalue!=0:
+			# undo the removals made by the previous value
+			# (the candidates removed by hand in this cell stay removed)
+			self.givens[row,column] = 0
+			for other in range(1, self.layout.groupsize((row,column))+1):
+				fact = (row, column, other)
+				if self.reasons.get(fact)!='given': continue
+				if fact in self.userremovals: self.reasons[fact] = 'user'
+				else: self.retract(fact)
+			self.updatefill(row, column)
+		if value!=0:
+			self.givens[row,column] = value
+			for other in range(1, self.layout.groupsize((row,column))+1):
+				if other==value: continue
+				fact = (row, column, other)
+				# (a removal by hand becomes a removal by the given value, but stays in userremovals
+				# so that it is a removal by hand again when the given value is cleared)
+				if self.reasons.get(fact)=='user': self.reasons[fact] = 'given'
+				elif fact in self.reasons: self.makepremise(fact, 'given')
+				else: self.removecandidate(row, column, other, 'given')
+			self.setvalue(row, column, value)
+		if propagate: self.propagate()
+
+	def setcandidate(self, row, column, value, allowed, propagate=True):
+		### allow or remove a candidate in a cell by hand
+		# input arguments:
+		# - allowed: whether the candidate is allowed
+		# - propagate: whether to apply the solving methods afterwards
+		# returns:
+		# whether the candidate is allowed after the change
+		# (a candidate removed by the solving methods or by a given value cannot be allowed by hand)
+		self.clearsolution()
+		fact = (int(row), int(column), int(value))
+		if not allowed:
+			self.userremovals.add(fact)
+			if fact not in self.reasons:
+				if value in self.candidates[fact[0]][fact[1]]:
+					self.removecandidate(fact[0], fact[1], fact[2], 'user')
+			elif isinstance(self.reasons[fact], tuple): self.makepremise(fact, 'user')
+		else:
+			self.userremovals.discard(fact)
+			if self.reasons.get(fact)=='user': self.retract(fact)
+		if propagate: self.propagate()
+		return (fact not in self.reasons)
+
+	def exclude(self, row, column, values):
+		### temporarily remove candidates from a cell (e.g. for a branch in search)
+		# input arguments:
+		# - values: list of values to remove (values that are no candidate are skipped)
+		# returns:
+		# list of the removals made, to be undone with release
+		facts = []
+		for value in values:
+			if value not in self.candidates[row][column]: continue
+			self.removecandidate(row, column, value, 'branch')
+			facts.append((int(row), int(column), int(value)))
+		return facts
+
+	def release(self, facts):
+		### undo removals made with exclude (and all removals deduced from them)
+		for fact in facts: self.retract(fact)
+
+	def iter_solutions(self, limit=None, order='fewest', stop=None, seed=None):
+		### generator over the solutions found by depth-first search
+		# (same as Suguru.iter_solutions, but a branch is made by excluding the other candidates
+		#  of the branching cell, and undone by releasing them, instead of copying the state)
+		if order not in ['fewest', 'lexicographic', 'reverse', 'random']:
+			msg = 'ERROR in SuguruSession.iter_solutions:'
+			msg += ' order {} not recognized.'.format(order)
+			raise Exception(msg)
+		rng = random.Random(seed)
+		if( self.nogoods is not None and self.zobristkeys is None ): self.inithash()
+		nsolutions = 0
+		# the open branches, as a stack of lists of
+		# [cell, values still to try, removals of the current value, hashes of the node, number of solutions]
+		stack = []
+		try:
+			while( limit is None or nsolutions<limit ):
+				if( stop is not None and stop() ): return
+				self.countstep()
+				(consistent, hashes) = self.expandnode()
+				if consistent:
+					(cell, values) = self.branchvalues(order, rng)
+					if cell is None:
+						nsolutions += 1
+						yield np.copy(self.grid)
+					else: stack.append([cell, values, [], hashes, nsolutions])
+				# go to the next untried value of the deepest open branch
+				while len(stack)>0:
+					self.release(stack[-1][2])
+					stack[-1][2] = []
+					if len(stack[-1][1])>0: break
+					# (the branch is exhausted; if it has no solutions, remember its node)
+					(_, _, _, hashes, nbefore) = stack.pop()
+					if( self.nogoods is not None and nsolutions==nbefore ):
+						for statehash in hashes: self.nogoods.add(statehash)
+				if len(stack)==0: return
+				((row, column), values, _, _, _) = stack[-1]
+				value = values.pop(0)
+				stack[-1][2] = self.exclude(row, column, [other for other in self.candidates[row][column] if other!=value])
+		finally:
+			while len(stack)>0: self.release(stack.pop()[2])
+			self.propagate()
+
+	def search(self, count=False, stop=None, verbose=False):
+		### depth-first search (see Suguru.search)
+		# the search runs in the session itself (see iter_solutions);
+		# the first solution found is filled in by removing the other candidates of the unknown cells,
+		# these removals are undone at the next edit of a given or a candidate (see clearsolution)
+		# returns:
+		# the number of solutions found
+		self.clearsolution()
+		nsolutions = 0
+		solution = None
+		for grid in self.iter_solutions(limit=(None if count else 1), stop=stop):
+			if solution is None: solution = grid
+			nsolutions += 1
+		if solution is None: return nsolutions
+		for (i, j) in np.argwhere(self.grid==0):
+			values = [value for value in self.candidates[i][j] if value!=solution[i,j]]
+			self.solutionfacts += self.exclude(i, j, values)
+		self.propagate()
+		if verbose:
+			msg = 'Filled remaining cells by search'
+			if count: msg += ' ({} solutions found)'.format(nsolutions)
+			print(msg+'.')
+		return nsolutions
+
+	def clearsolution(self):
+		### undo the filling in of the solution found by search
+		self.release(self.solutionfacts)
+		self.solutionfacts = []
+
+	def solve(self, verbose=False, probe=True, probemaxcandidates=2, probebudget=50,
+	          search=False, techniques=None, timelimit=None, steplimit=None):
+		### solve the suguru in the session (see Suguru.solve)
+		# the deductions of the solving methods in propagate are kept up to date in the session;
+		# the removals of probing and of other techniques cannot be tracked,
+		# so probe, probemaxcandidates, probebudget and techniques are ignored
+		# (use tosuguru to get a plain Suguru for them).
+		# with search, the solution is filled in as in the search method,
+		# and the time and step limits only apply to the search.
+		self.propagate(verbose=verbose)
+		limitreached = False
+		if( search and not self.check_complete() and self.check_consistent() ):
+			self.deadline = None if timelimit is None else time.monotonic()+timelimit
+			self.stepsleft = steplimit
+			try:
+				if self.search(verbose=verbose)==0: return (-1, 'Suguru invalid')
+			except SuguruLimitReached as e:
+				limitreached = True
+				if verbose: print('Stopped solving: {}.'.format(e))
+			finally:
+				self.deadline = None
+				self.stepsleft = None
+		(resultcode, resultmessage) = self.status()
+		if( resultcode==1 and limitreached ): return (2, 'Suguru limit reached')
+		return (resultcode, resultmessage)
+
+	def cellfacts(self, row, column):
+		### get the removals that make the value of a filled cell known
+		value = self.grid[row,column]
+		facts = []
+		for other in range(1, self.layout.groupsize((row,column))+1):
+			fact = (row, column, other)
+			if( other!=value and fact in self.reasons ): facts.append(fact)
+		return facts
+
+	def antecedents(self, row, column, reason):
+		### get the removals from which the removal of a candidate in a cell is deduced
+		# input arguments:
+		# - reason: see Suguru.removecandidate
+		# returns:
+		# tuple of removals (row, column, value)
+		kind = reason[0]
+		if kind=='neighbour':
+			return tuple(self.cellfacts(int(reason[1]), int(reason[2])))
+		if kind=='group':
+			(groupid, value) = (reason[1], reason[2])
+			for (i, j) in self.layout.groupindices(groupid):
+				if self.grid[i,j]==value: return tuple(self.cellfacts(int(i), int(j)))
+			return ()
+		if kind=='only':
+			(groupid, value) = (reason[1], reason[2])
+			facts = []
+			for (i, j) in self.layout.groupindices(groupid):
+				if( i==row and j==column ): continue
+				if (int(i), int(j), value) in self.reasons: facts.append((int(i), int(j), value))
+			return tuple(facts)
+		if kind=='tuple':
+			facts = []
+			for (i, j) in self.knowns_in_group(reason[1]): facts += self.cellfacts(int(i), int(j))
+			return tuple(facts)
+		msg = 'ERROR in SuguruSession.antecedents:'
+		msg += ' removals with reason {} cannot be tracked;'.format(reason)
+		msg += ' use tosuguru to get a plain Suguru for probing.'
+		raise Exception(msg)
+
+	def removecandidate(self, row, column, value, reason=None):
+		### remove a candidate value from a given cell and record why it was removed
+		# (see Suguru.removecandidate; the reasons 'given', 'user' and 'branch' are used for premises)
+		fact = (int(row), int(column), int(value))
+		if reason in ['given', 'user', 'branch']: antecedents = reason
+		else:
+			antecedents = self.antecedents(fact[0], fact[1], reason)
+			for antecedent in antecedents: self.dependents.setdefault(antecedent, set()).add(fact)
+		Suguru.removecandidate(self, row, column, value)
+		self.reasons[fact] = antecedents
+		self.markdirty(fact[0], fact[1])
+
+	def setvalue(self, row, column, value):
+		### set a value in a given cell (see Suguru.setvalue)
+		if self.grid[row,column]==value: return
+		Suguru.setvalue(self, row, column, value)
+		self.markdirty(int(row), int(column))
+
+	def makepremise(self, fact, kind):
+		### turn a deduced removal into a premise ('given' or 'user')
+		# (the removals deduced from it stay valid)
+		reason = self.reasons[fact]
+		if isinstance(reason, tuple):
+			for antecedent in reason: self.dependents.get(antecedent, set()).discard(fact)
+			self.reasons[fact] = kind
+
+	def retract(self, fact):
+		### undo a removal and all removals that were deduced from it
+		stack = [fact]
+		while len(stack)>0:
+			fact = stack.pop()
+			if fact not in self.reasons: continue
+			reason = self.reasons.pop(fact)
+			if isinstance(reason, tuple):
+				for antecedent in reason: self.dependents.get(antecedent, set()).discard(fact)
+			stack += self.dependents.pop(fact, [])
+			(row, column, value) = fact
+			self.candidates[row][column].append(value)
+			self.candidates[row][column].sort()
+			if self.zobristkeys is not None: self.statehash ^= self.zobristkeys[0][row][column][value]
+			self.updatefill(row, column)
+			# (the cells around it may now allow other deductions)
+			self.markdirty(row, column, neighbours=True)
+
+	def updatefill(self, row, column):
+		### clear a deduced value from a cell if it no longer follows from its candidates
+		value = self.grid[row,column]
+		if( value==0 or self.givens[row,column]!=0 ): return
+		if self.candidates[row][column]!=[value]: self.setvalue(row, column, 0)
+
+	def markdirty(self, row, column, neighbours=False):
+		### mark a cell and its group (and optionally its neighbours) for applying the solving methods
+		cells = [(row, column)]
+		if neighbours: cells += self.layout.neighbourcells[row][column]
+		for (i, j) in cells:
+			self.dirtycells.add((i, j))
+			self.dirtygroups.add(int(self.layout.layout[i,j]))
+		self.changedcells.add((row, column))
+
+	def propagate(self, verbose=False):
+		### apply the basic and intermediate solving methods to the marked cells and groups
+		# until none of them makes progress (see Suguru.propagate)
+		# returns:
+		# True if any candidate was removed or any value was filled, False otherwise
+		changed = False
+		while( len(self.dirtycells)>0 or len(self.dirtygroups)>0 ):
+			while len(self.dirtycells)>0:
+				(row, column) = self.dirtycells.pop()
+				candidates = self.candidates[row][column]
+				if( self.grid[row,column]==0 and len(candidates)==1 ):
+					self.setvalue(row, column, candidates[0])
+					changed = True
+					if verbose:
+						msg = 'Filled value {} on position ({},{})'.format(candidates[0],row,column)
+						msg += ' because it is the only remaining candidate.'
+						print(msg)
+				if self.grid[row,column]!=0:
+					if self.reduceneighbours((row, column), verbose=verbose): changed = True
+			if len(self.dirtygroups)>0:
+				groupid = self.dirtygroups.pop()
+				if self.reducegroups(groupid, verbose=verbose): changed = True
+				if self.fillgroups(groupid, verbose=verbose): changed = True
+				if self.reducetuples(groupid, verbose=verbose): changed = True
+		return changed
+
+
+if __name__=='__main__':
+	# testing section
+
+	suguru = Suguru()
+	suguru.initfromtxt('../examples/example1.txt')
+	grid = np.copy(suguru.grid)
+	layout = np.copy(suguru.layout.layout)
+
+	session = SuguruSession()
+	starttime = time.time()
+	session.initfromgrids(layout, grid)
+	print('Initial propagation: {:.2f} ms'.format((time.time()-starttime)*1000))
+	print(session.status())
+	# remove and restore each given, and check that the result is the same as propagating from scratch
+	for (i, j) in np.argwhere(grid):
+		starttime = time.time()
+		session.setgiven(i, j, 0)
+		edittime = time.time()-starttime
+		reference = Suguru()
+		grid[i,j], value = 0, grid[i,j]
+		reference.initfromgrids(layout, grid)
+		reference.propagate()
+		same = (np.array_equal(reference.grid, session.grid) and reference.candidates==session.candidates)
+		print('Removed given at ({},{}): {:.2f} ms, same as from scratch: {}'.format(i, j, edittime*1000, same))
+		grid[i,j] = value
+		session.setgiven(i, j, value)
+	print(session.status())
+
+	# a candidate removed by hand in a cell that then gets a given value cannot be allowed by hand
+	# (also not when the candidate was removed by hand before the given value was set;
+	# the given value at (0,0) is cleared first, else 3 is no candidate at (1,2) anyway)
+	def samestate(session, reference):
+		return (np.array_equal(reference.grid, session.grid) and reference.candidates==session.candidates)
+	fromgivens = Suguru()
+	fromgivens.initfromgrids(layout, grid)
+	fromgivens.propagate()
+	session.setgiven(0, 0, 0)
+	session.setcandidate(1, 2, 3, False)
+	session.setgiven(1, 2, 4)
+	allowed = session.setcandidate(1, 2, 3, True)
+	reference = Suguru()
+	reference.initfromgrids(layout, session.givens)
+	reference.propagate()
+	print('Allowed removed candidate of a given: {}, same as from scratch: {}'.format(
+	  allowed, samestate(session, reference)))
+	session.setgiven(1, 2, 0)
+	session.setcandidate(1, 2, 3, True)
+	session.setgiven(0, 0, grid[0,0])
+	print('Cleared given again, same as at the start: {}'.format(samestate(session, fromgivens)))
+	# random edits of givens and candidates (a given cell should never have another candidate)
+	rng = np.random.default_rng(1)
+	nwrong = 0
+	nedits = 500
+	for k in range(nedits):
+		(i, j) = (int(rng.integers(layout.shape[0])), int(rng.integers(layout.shape[1])))
+		value = int(rng.integers(1, session.layout.groupsize((i,j))+1))
+		if rng.random()<0.3: session.setgiven(i, j, value if rng.random()<0.7 else 0)
+		else: session.setcandidate(i, j, value, rng.random()<0.5)
+		if any(any(c!=session.givens[row,column] for c in session.candidates[row][column])
+		       for (row, column) in np.argwhere(session.givens)): nwrong += 1
+	print('Random edits: {} of {} with other candidates in a given cell'.format(nwrong, nedits))
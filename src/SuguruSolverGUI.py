@@ -5,10 +5,12 @@ import sys
 import os
 import numpy as np
 import random
-import matplotlib
 from SuguruLayout import SuguruLayout
 from Suguru import Suguru
-from SuguruImageReader import SuguruImageReader
+from SuguruSession import SuguruSession
+from SuguruCanvas import SuguruCanvas
+# note: SuguruImageReader is only imported when loading an image,
+#       to avoid loading its dependencies (opencv, matplotlib) at startup
 try:
         import Tkinter as tk
         import ScrolledText as scrtxt
@@ -18,6 +20,17 @@ except ImportError:
         import tkinter.scrolledtext as scrtxt
         import tkinter.filedialog as fldlg
 
+def rainbowcolors(ncolors):
+        ### get a list of hex color strings evenly spaced along the rainbow color map
+        # (same colors as the 'rainbow' color map in matplotlib, without importing it)
+        colors = []
+        for i in range(ncolors):
+                x = i/(ncolors-1) if ncolors>1 else 0.
+                rgb = [abs(2*x-0.5), np.sin(x*np.pi), np.cos(x*np.pi/2)]
+                rgb = [min(max(c,0.),1.) for c in rgb]
+                colors.append( '#'+''.join('{:02x}'.format(int(round(c*255))) for c in rgb) )
+        return colors
+
 class StdOutRedirector:
         ### helper class to redirect print output to GUI widget
         # use as follows:
@@ -48,6 +61,7 @@ class SuguruSolverGUI:
                 self.frelief = 'solid' # frame border relief
                 self.fpadx = 15 # frame inner horizontal padding
                 self.fpady = 15 # frame inner vertical padding
+                self.canvasthreshold = 144 # number of cells above which the grid is drawn on a canvas
 
                 # define top level frames
                 self.left_buttons_frame = tk.Frame(master, width=200)
@@ -96,6 +110,16 @@ class SuguruSolverGUI:
                 self.candidate_frame = tk.Frame(self.middle_grid_frame, height=30, width=200)
                 #self.candidate_frame.grid(row=4, column=0, padx=10, pady=10)
 
+                # define a canvas for large grids (see initgrid)
+                self.canvas = None
+
+                # live solving: the digit grid is solved again after every edit (see togglelive)
+                self.live = tk.IntVar(value=0)
+                self.session = None
+                # texts of the cells showing a value deduced by the live solving
+                self.liveshown = {}
+                self.livestatus = None
+
                 # initialize the grid with default size
                 self.initgrid()
 
@@ -156,6 +180,9 @@ class SuguruSolverGUI:
                 self.abort_button = tk.Button(self.solve_buttons_frame, text='Abort', command=self.abort,
                         width=self.bwidth, height=self.bheight)
                 self.abort_button.grid(row=2, column=0)
+                self.live_button = tk.Checkbutton(self.solve_buttons_frame, text='Live solving',
+                        variable=self.live, command=self.togglelive)
+                self.live_button.grid(row=3, column=0)
                 self.hint_button = tk.Button(self.solve_buttons_frame, text='Hint', command=self.hint,
                         width=self.bwidth, height=self.bheight)
                 self.reduce_button = tk.Button(self.solve_buttons_frame, text='Reduce', command=self.reduce,
@@ -190,6 +217,12 @@ class SuguruSolverGUI:
                         command=self.load_image,
                         width=self.bwidth, height=self.bheight)
                 self.load_image_button.grid(row=3, column=0)
+                # add a button to show the diagnostic plots of the last image reading
+                self.image_diagnostics_button = tk.Button(self.io_buttons_frame,
+                        text='Image diagnostics',
+                        command=self.show_image_diagnostics,
+                        width=self.bwidth, height=self.bheight)
+                self.image_diagnostics_button.grid(row=4, column=0)
                 
                 # define a frame for clearing and closing buttons
                 self.close_buttons_frame = tk.Frame(self.left_buttons_frame, width=200,
@@ -225,6 +258,10 @@ class SuguruSolverGUI:
                 
                 # other settings
                 self.logfilename = 'logs/currentlog.txt'
+                # cache for image reading results (created when first loading an image)
+                self.imagecache = None
+                # reader of the last loaded image (kept for making diagnostic plots on request)
+                self.imagereader = None
                 
         def initgrid(self, nrows=6, ncols=6, maxgroupsize=5):
                 ### (re-) initialize the grid with specified parameters
@@ -240,6 +277,10 @@ class SuguruSolverGUI:
                         child.destroy()
                 for child in self.candidate_frame.winfo_children():
                         child.destroy()
+                if self.canvas is not None:
+                        self.canvas.destroy()
+                        self.canvas = None
+                self.stoplive()
                         
                 # initializations
                 self.gridnrows = nrows
@@ -248,6 +289,21 @@ class SuguruSolverGUI:
                 self.gridcells = []
                 self.layoutcells = []
                 self.candidatecells = []
+
+                # for large grids, draw all cells on a single canvas
+                # (the cells and candidates are then accessed through Entry-like and IntVar-like objects,
+                #  so the rest of the GUI works the same way for both)
+                if nrows*ncols > self.canvasthreshold:
+                        self.canvas = SuguruCanvas(self.middle_grid_frame, nrows, ncols, maxgroupsize)
+                        self.canvas.oncellchange = self.livecellchanged
+                        self.canvas.oncandidatechange = self.livecandidatechanged
+                        for i in range(self.gridnrows):
+                                self.layoutcells.append([self.canvas.cell('L', i, j) for j in range(self.gridncols)])
+                                self.gridcells.append([self.canvas.cell('G', i, j) for j in range(self.gridncols)])
+                                self.candidatecells.append([[{'button': None, 'var': self.canvas.candidate(i, j, k)}
+                                        for k in range(self.maxgroupsize)] for j in range(self.gridncols)])
+                        self.seteditmode()
+                        return
                 
                 # make layout entries
                 for i in range(self.gridnrows):
@@ -268,6 +324,8 @@ class SuguruSolverGUI:
                                 self.gridcells[i].append(cell_entry)
                                 self.gridcells[i][j].bind("<1>",lambda event,row=i,col=j : 
                                                                                         self.showcandidates(event,row,col))
+                                self.gridcells[i][j].bind("<KeyRelease>",lambda event,row=i,col=j :
+                                                                                        self.livecellchanged(row,col))
 
                 # make candidate entries
                 for i in range(self.gridnrows):
@@ -278,13 +336,15 @@ class SuguruSolverGUI:
                                         var = tk.IntVar(value=1)
                                         candidate_rbutton = tk.Checkbutton(self.candidate_frame,text=str(k+1),
                                                         font="Calibri 20",justify='center',width=2,indicatoron=False,
-                                                        var=var,background="red",selectcolor='green')
+                                                        var=var,background="red",selectcolor='green',
+                                                        command=lambda row=i,col=j,k=k : self.livecandidatechanged(row,col,k))
                                         self.candidatecells[i][j].append({'button':candidate_rbutton,'var':var})
 
                 # set focus to (0,0) and show corresponding candidates
                 #self.gridcells[0][0].focus()
                 #for k in range(self.maxgroupsize): 
                 #        self.candidatecells[0][0][k]['button'].grid(row=0,column=k)
+                self.seteditmode()
                 
         def open_change_dim_window(self):
                 ### change the size of the layout and grid
@@ -325,6 +385,12 @@ class SuguruSolverGUI:
 
         def seteditmode(self):
                 ### toggle between layout and grid editing
+                if self.canvas is not None:
+                    self.layout_frame.grid_forget()
+                    self.grid_frame.grid_forget()
+                    self.canvas.grid(**self.glargs)
+                    self.canvas.setmode(self.editmode.get())
+                    return
                 if self.editmode.get()=='L':
                     self.grid_frame.grid_forget()
                     self.layout_frame.grid(**self.glargs)
@@ -363,11 +429,15 @@ class SuguruSolverGUI:
                         self.hint_button.grid(row=0,column=0,ipadx=self.bwidth,ipady=self.bheight)
                         self.reduce_button.grid(row=0,column=1,ipadx=self.bwidth,ipady=self.bheight)
                         self.gridcells[0][0].focus()
-                        for k in range(self.maxgroupsize): self.candidatecells[0][0][k]['button'].grid(row=0,column=k)
+                        self.showcandidates(None,0,0)
 
         def showcandidates(self,event,i,j):
                 ### show the candidates for a given cell
                 if self.mode.get()=='A': return None
+                # (on a canvas, the candidates of the selected cell are drawn in the cell itself)
+                if self.canvas is not None:
+                        self.canvas.select(i,j)
+                        return None
                 for wid in self.candidate_frame.grid_slaves():
                         wid.grid_forget()
                 for k,buttondict in enumerate(self.candidatecells[i][j]):
@@ -477,11 +547,7 @@ class SuguruSolverGUI:
                         msg += ' current layout: {}'.format((self.ngridrows,self.ngridcols))
                         raise Exception(msg)
                 # define colors
-                crgba = matplotlib.cm.get_cmap('rainbow', slayout.ngroups)
-                chex = []
-                for i in range(crgba.N):
-                        rgba = crgba(i)
-                        chex.append( matplotlib.colors.rgb2hex(rgba) )
+                chex = rainbowcolors(slayout.ngroups)
                 random.shuffle(chex)
                 # set cell colors and values
                 for i in range(self.gridnrows):
@@ -493,15 +559,33 @@ class SuguruSolverGUI:
                                 self.layoutcells[i][j].insert(0,str(slayout.layout[i,j]))
                 # set layout
                 self.layout = slayout.layout
+                # (a running live solving session is for the previous layout)
+                if self.session is not None:
+                        self.live.set(0)
+                        self.togglelive()
                 
         def solve(self):
                 ### read the suguru currently stored in the GUI and solve it
                 
                 # read the suguru
-                layout = self.readlayout()
-                grid = self.readgrid()
-                suguru = Suguru()
-                suguru.initfromgrids(layout, grid)
+                # (when live solving, start from its current state instead)
+                if self.session is not None:
+                        suguru = self.session.tosuguru()
+                        self.live.set(0)
+                        self.togglelive()
+                else:
+                        layout = self.readlayout()
+                        grid = self.readgrid()
+                        suguru = Suguru()
+                        suguru.initfromgrids(layout, grid)
+                        # remove the candidates that were removed by hand
+                        candidates = self.getcandidates()
+                        for i in range(self.gridnrows):
+                                for j in range(self.gridncols):
+                                        if grid[i,j]!=0: continue
+                                        for value in list(suguru.candidates[i][j]):
+                                                if value not in candidates[i][j]:
+                                                        suguru.removecandidate(i, j, value, 'user')
                 
                 # display a message that solving will start
                 message =  '[notification:] Now solving...\n'
@@ -527,6 +611,98 @@ class SuguruSolverGUI:
                 
         def abort(self):
                 pass # not yet implemented
+
+        def togglelive(self):
+                ### start or stop live solving (depending on the state of the live solving button)
+                # while live solving, every edit of a cell or candidate in the digit grid
+                # is passed to a SuguruSession, and the deduced values and candidates are shown immediately.
+                if not self.live.get():
+                        # remove the deduced values and restore the candidates removed by hand
+                        if self.session is None: return
+                        for (i, j) in self.liveshown:
+                                self.gridcells[i][j].delete(0,tk.END)
+                                self.gridcells[i][j].config(foreground='black')
+                        for i in range(self.gridnrows):
+                                for j in range(self.gridncols):
+                                        for k in range(self.maxgroupsize):
+                                                allowed = (i,j,k+1) not in self.session.userremovals
+                                                self.candidatecells[i][j][k]['var'].set(int(allowed))
+                        self.stoplive()
+                        return
+                layout = self.readlayout()
+                grid = self.readgrid()
+                if( layout is None or grid is None ):
+                        self.live.set(0)
+                        return
+                self.session = SuguruSession()
+                try:
+                        self.session.initfromgrids(layout, grid, candidates=self.getcandidates())
+                except Exception as e:
+                        message = '[notification:] ERROR: could not start live solving: '+str(e)+'\n\n'
+                        self.messages_text.insert(tk.INSERT,message)
+                        self.messages_text.see(tk.END)
+                        self.stoplive()
+                        return
+                self.liveshown = {}
+                self.livestatus = None
+                message = '[notification:] Live solving started: deduced values are shown in green.\n\n'
+                self.messages_text.insert(tk.INSERT,message)
+                self.messages_text.see(tk.END)
+                self.showlive()
+
+        def stoplive(self):
+                ### forget the live solving session (without changing the GUI cells)
+                self.live.set(0)
+                self.session = None
+                self.liveshown = {}
+                self.livestatus = None
+
+        def livecellchanged(self, i, j):
+                ### pass an edit of a digit grid cell to the live solving session
+                if self.session is None: return
+                text = self.gridcells[i][j].get()
+                if text==self.liveshown.get((i,j), None): return
+                # the cell is now filled (or cleared) by the user
+                self.liveshown.pop((i,j), None)
+                self.gridcells[i][j].config(foreground='black')
+                if text in ['', '_']: value = 0
+                else:
+                        try: value = int(text)
+                        except: return
+                        if( value<1 or value>self.maxgroupsize ): return
+                self.session.setgiven(i, j, value)
+                self.showlive()
+
+        def livecandidatechanged(self, i, j, k):
+                ### pass an edit of a candidate to the live solving session
+                if self.session is None: return
+                self.session.setcandidate(i, j, k+1, self.candidatecells[i][j][k]['var'].get()==1)
+                self.showlive()
+
+        def showlive(self):
+                ### show the values and candidates that changed in the live solving session
+                session = self.session
+                for (i, j) in session.popchanges():
+                        if session.givens[i,j]==0:
+                                text = str(session.grid[i,j]) if session.grid[i,j]!=0 else ''
+                                current = self.gridcells[i][j].get()
+                                # (cells filled in by the user are not overwritten)
+                                if( (i,j) in self.liveshown or current=='' ):
+                                        self.gridcells[i][j].delete(0,tk.END)
+                                        self.gridcells[i][j].insert(0,text)
+                                        self.gridcells[i][j].config(foreground='green')
+                                        if text=='': self.liveshown.pop((i,j), None)
+                                        else: self.liveshown[(i,j)] = text
+                        for k in range(self.maxgroupsize):
+                                allowed = (k+1) in session.candidates[i][j]
+                                self.candidatecells[i][j][k]['var'].set(int(allowed))
+                # notify when the status changes
+                (resultcode, resultmessage) = session.status()
+                if resultcode!=self.livestatus:
+                        self.livestatus = resultcode
+                        message = '[notification:] Live solving: '+resultmessage+'\n\n'
+                        self.messages_text.insert(tk.INSERT,message)
+                        self.messages_text.see(tk.END)
  
         def save(self):
                 abspath = os.path.abspath(os.path.dirname(__file__))
@@ -602,9 +778,18 @@ class SuguruSolverGUI:
                         return
                 try:
                         # reconstruct a Suguru instance from the selected image
+                        # (reloading an image that was read before takes the results from the cache)
+                        from SuguruImageReader import SuguruImageReader
+                        if self.imagecache is None:
+                                from SuguruImageCache import SuguruImageCache
+                                self.imagecache = SuguruImageCache()
                         reader = SuguruImageReader()
-                        reader.loadimage(filename)
-                        reader.findsuguru(doplot=True)
+                        reader.loadimage(filename, lazy=True)
+                        reader.findsuguru(doplot=False, cache=self.imagecache)
+                        self.imagereader = reader
+                        if reader.cachehit:
+                                message = '[notification:] Image was read before, using cached results.\n'
+                                self.messages_text.insert(tk.INSERT,message)
                         self.suguru = Suguru()
                         self.suguru.initfromgrids(reader.layout, reader.grid)
                         nrows, ncols = self.suguru.layout.layout.shape
@@ -614,7 +799,8 @@ class SuguruSolverGUI:
                         self.initgrid( nrows=nrows, ncols=ncols, maxgroupsize=maxgroupsize )
                         self.updategrid(self.suguru.grid)
                         self.setlayout(self.suguru.layout)
-                        message =  '[notification:] Suguru loaded successfully.\n\n'
+                        message =  '[notification:] Suguru loaded successfully.\n'
+                        message += '(press "Image diagnostics" to inspect the image reading)\n\n'
                         self.messages_text.insert(tk.INSERT,message)
                         self.messages_text.see(tk.END)
                 except:
@@ -622,9 +808,25 @@ class SuguruSolverGUI:
                         self.messages_text.insert(tk.INSERT,message)
                         self.messages_text.see(tk.END)
                         return None
+
+        def show_image_diagnostics(self):
+                ### show the diagnostic plots of the last image reading
+                # (they are only made on request, as they take much longer than the reading itself)
+                if self.imagereader is None:
+                        message = '[notification:] No image was loaded yet.\n\n'
+                        self.messages_text.insert(tk.INSERT,message)
+                        self.messages_text.see(tk.END)
+                        return
+                try:
+                        self.imagereader.showdiagnostics()
+                except:
+                        message = '[notification:] ERROR: could not make the diagnostic plots.\n\n'
+                        self.messages_text.insert(tk.INSERT,message)
+                        self.messages_text.see(tk.END)
         
         def clear(self):
                 ### clear the current grid (but keep layout)
+                self.stoplive()
                 for i in range(self.gridnrows):
                         for j in range(self.gridncols):
                                 # delete the value from the grid cell
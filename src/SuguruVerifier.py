@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+# imports
+import numpy as np
+from SuguruLayout import SuguruLayout
+
+
+def verifygrids(layout, grids, returnconflicts=False, chunksize=10000):
+	### verify a stack of completed grids sharing the same layout
+	# a grid is valid if each group holds the values 1 to its size exactly once
+	# and no two neighbouring cells (including diagonals) hold the same value.
+	# input arguments:
+	# - layout: SuguruLayout instance
+	# - grids: 3D numpy array of integers with shape (number of grids, nrows, ncols)
+	# - returnconflicts: whether to return the first conflicting cell of each grid
+	# - chunksize: number of grids to verify at once (limits memory usage)
+	# returns:
+	# boolean numpy array with shape (number of grids,), True for valid grids,
+	# and if returnconflicts is True, also an integer numpy array with shape (number of grids, 2)
+	# holding (row, column) of the first conflicting cell of each grid ((-1,-1) for valid grids)
+
+	# do some checks on the input
+	if not isinstance(layout, SuguruLayout):
+		msg = 'ERROR in verifygrids:'
+		msg += ' expected a SuguruLayout instance'
+		msg += ' but found {}'.format(type(layout))
+		raise Exception(msg)
+	if not isinstance(grids, np.ndarray):
+		msg = 'ERROR in verifygrids:'
+		msg += ' expected a np array but found {}.'.format(type(grids))
+		raise Exception(msg)
+	if( len(grids.shape)!=3 or grids.shape[1:]!=layout.layout.shape ):
+		msg = 'ERROR in verifygrids:'
+		msg += ' expected an array of shape (N,{},{})'.format(*layout.layout.shape)
+		msg += ' but found {}.'.format(grids.shape)
+		raise Exception(msg)
+	# verify the grids chunk by chunk
+	ngrids = grids.shape[0]
+	valid = np.zeros(ngrids, dtype=bool)
+	conflicts = -np.ones((ngrids,2), dtype=int)
+	for start in range(0, ngrids, chunksize):
+		stop = min(start+chunksize, ngrids)
+		conflictmask = findconflicts(layout, grids[start:stop])
+		flatmask = conflictmask.reshape(stop-start,-1)
+		valid[start:stop] = ~np.any(flatmask, axis=1)
+		if returnconflicts:
+			firstconflict = np.argmax(flatmask, axis=1)
+			(rows, cols) = np.divmod(firstconflict, layout.layout.shape[1])
+			invalid = ~valid[start:stop]
+			conflicts[start:stop][invalid,0] = rows[invalid]
+			conflicts[start:stop][invalid,1] = cols[invalid]
+	if returnconflicts: return (valid, conflicts)
+	return valid
+
+
+def findconflicts(layout, grids):
+	### find all conflicting cells in a stack of grids sharing the same layout
+	# input arguments: see verifygrids
+	# returns:
+	# boolean numpy array with the same shape as grids, True for conflicting cells
+	(ngrids, nrows, ncols) = grids.shape
+	groups = layout.layout
+	# check the value range (1 to the size of the group)
+	groupsizes = layout.groupsizes[groups]
+	conflictmask = (grids<1) | (grids>groupsizes)
+	# check for duplicate values in groups using per-group value histograms
+	# (values out of range are put in an overflow bin, they are flagged above)
+	nvalues = layout.maxgroupsize()+2
+	values = np.clip(grids, 0, nvalues-1)
+	gridindices = np.arange(ngrids).reshape(-1,1,1)
+	binindices = (gridindices*layout.ngroups + groups)*nvalues + values
+	histograms = np.bincount(binindices.ravel(), minlength=ngrids*layout.ngroups*nvalues)
+	histograms = histograms.reshape(ngrids, layout.ngroups, nvalues)
+	conflictmask |= histograms[gridindices, groups, values]>1
+	# check for equal values in neighbouring cells using shifted comparisons
+	for drow in [-1,0,1]:
+		for dcol in [-1,0,1]:
+			if( drow==0 and dcol==0 ): continue
+			cells = (slice(None), slice(max(0,-drow), nrows-max(0,drow)), slice(max(0,-dcol), ncols-max(0,dcol)))
+			neighbours = (slice(None), slice(max(0,drow), nrows-max(0,-drow)), slice(max(0,dcol), ncols-max(0,-dcol)))
+			conflictmask[cells] |= (grids[cells]==grids[neighbours])
+	return conflictmask